@@ -0,0 +1,209 @@
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from journal import JournalDict
+
+# headers describing the transfer, not the decoded body that is archived
+_TRANSFER_HEADERS = {b'content-encoding', b'transfer-encoding', b'content-length'}
+
+
+def read_member(file, offset, length):
+    """bytes of the gzip member at *offset* of segment *file*."""
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(length))
+
+
+class Archive:
+    """
+    records packed into gzip compressed segments in directory *path* instead of one file each.
+    every record is a gzip member of its own, so a segment stays readable by gzip tools and one record
+    is read by seeking to it. the index maps a key to the segment, offset and length of its record.
+    :param segment_size: bytes of a segment before the next one is started.
+    :param level: gzip compression level.
+    :param fsync_interval: max seconds between two fsyncs of the segment being written.
+    """
+
+    prefix = 'records'
+    suffix = '.gz'
+
+    def __init__(self, path, segment_size=64 << 20, level=6, compact_every=100_000, fsync_interval=1.0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.level = level
+        self.fsync_interval = fsync_interval
+        self.index = JournalDict(self.path / 'index', compact_every=compact_every)
+        self.lock = threading.Lock()
+        self._f = None
+        self._synced = time.monotonic()
+        # records are indexed after they are written, bytes past the last indexed record are a torn write
+        ends = {}
+        for _, (segment, offset, length) in self.index.items():
+            ends[segment] = max(ends.get(segment, 0), offset + length)
+        self.segment = max(ends, default=0)
+        self.size = ends.get(self.segment, 0)
+
+    @staticmethod
+    def is_archive(path):
+        path = Path(path)
+        return (path / 'index').exists() or (path / 'index.journal').exists()
+
+    def _segment(self, n):
+        return self.path / f'{self.prefix}-{n:05}{self.suffix}'
+
+    def _append(self, key, data):
+        data = gzip.compress(data, self.level, mtime=0)
+        with self.lock:
+            if self.size and self.size + len(data) > self.segment_size:
+                self._close()
+                self.segment, self.size = self.segment + 1, 0
+            if self._f is None:
+                self._f = self._segment(self.segment).open('ab')
+                self._f.truncate(self.size)
+            segment, offset = self.segment, self.size
+            self._f.write(data)
+            self._f.flush()
+            self.size += len(data)
+            if time.monotonic() - self._synced > self.fsync_interval:
+                self._sync()
+        self.index[key] = [segment, offset, len(data)]
+        return len(data)
+
+    def _read(self, key):
+        segment, offset, length = self.index[key]
+        return read_member(self._segment(segment), offset, length)
+
+    def locations(self):
+        """yield (key, segment file, offset, length) of every record in the order they were added."""
+        for key, (segment, offset, length) in sorted(self.index.items(), key=lambda item: item[1]):
+            yield key, str(self._segment(segment)), offset, length
+
+    def _members(self):
+        files = {}
+        try:
+            for key, file, offset, length in self.locations():
+                f = files.get(file)
+                if f is None:
+                    f = files[file] = open(file, 'rb')
+                f.seek(offset)
+                yield key, gzip.decompress(f.read(length))
+        finally:
+            for f in files.values():
+                f.close()
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def flush(self):
+        with self.lock:
+            if self._f is not None:
+                self._sync()
+        self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self._close()
+        self.index.flush()
+
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._synced = time.monotonic()
+
+    def _close(self):
+        if self._f is not None:
+            self._sync()
+            self._f.close()
+            self._f = None
+
+
+class TextArchive(Archive):
+    """
+    pages of TextCrawler packed into JSONL segments, keyed by the relative path a page would have as a file,
+    which is made of its catalog and title.
+    """
+
+    prefix = 'pages'
+    suffix = '.jsonl.gz'
+
+    def add(self, key, record):
+        """append *record*, a json serializable dict, under *key*, return the bytes written."""
+        return self._append(key, (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def get(self, key):
+        return json.loads(self._read(key))
+
+    def items(self):
+        """yield (key, record) of every page in the order they were added."""
+        for key, data in self._members():
+            yield key, json.loads(data)
+
+    def export(self, dst):
+        """write every page back to the directory layout of one file per page under *dst*, return the count."""
+        dirs, n = set(), 0
+        for key, record in self.items():
+            p = Path(dst, key)
+            if p.parent not in dirs:
+                p.parent.mkdir(parents=True, exist_ok=True)
+                dirs.add(p.parent)
+            p.write_text(record['text'], encoding='utf-8')
+            n += 1
+        return n
+
+
+class ResponseArchive(Archive):
+    """
+    fetched pages kept as WARC/1.1 response records keyed by url, so they can be extracted again without
+    fetching. the body is stored decoded, transfer headers are dropped and Content-Length is the decoded length.
+    """
+
+    prefix = 'responses'
+    suffix = '.warc.gz'
+
+    def add(self, url, r):
+        """append httpx response *r* of *url*, return the bytes written."""
+        body = r.content
+        head = [f'HTTP/1.1 {r.status_code} {r.reason_phrase}'.encode('ascii')]
+        head += [k + b': ' + v for k, v in r.headers.raw if k.lower() not in _TRANSFER_HEADERS]
+        head.append(b'Content-Length: %d' % len(body))
+        block = b'\r\n'.join(head) + b'\r\n\r\n' + body
+        warc = (f'WARC/1.1\r\n'
+                f'WARC-Type: response\r\n'
+                f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+                f'WARC-Date: {datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}\r\n'
+                f'WARC-Target-URI: {url}\r\n'
+                f'Content-Type: application/http;msgtype=response\r\n'
+                f'Content-Length: {len(block)}\r\n\r\n').encode('utf-8')
+        return self._append(url, warc + block + b'\r\n\r\n')
+
+    @staticmethod
+    def parse(record):
+        """an httpx.Response out of the bytes of a WARC response record."""
+        warc, _, block = record.partition(b'\r\n\r\n')
+        fields = dict(line.split(': ', 1) for line in warc.decode('utf-8').split('\r\n')[1:])
+        block = block[:int(fields['Content-Length'])]
+        head, _, body = block.partition(b'\r\n\r\n')
+        status, *lines = head.split(b'\r\n')
+        headers = [line.split(b': ', 1) for line in lines]
+        return httpx.Response(int(status.split(b' ', 2)[1]), headers=headers, content=body,
+                              request=httpx.Request('GET', fields['WARC-Target-URI']))
+
+    def get(self, url):
+        return self.parse(self._read(url))
+
+    def items(self):
+        """yield (url, response) of every page in the order they were fetched."""
+        for url, data in self._members():
+            yield url, self.parse(data)
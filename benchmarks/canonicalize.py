@@ -0,0 +1,85 @@
+"""
+measure links/sec of the url canonicalizer, without its cache and with it, against the former hand written join.
+usage: python benchmarks/canonicalize.py [pages] [links per page]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from canonical import Canonicalizer  # noqa: E402
+
+DOMAIN = 'www.example.com'
+
+
+def synthetic_links(pages=2000, links=150, seed=0):
+    # navigation repeats across pages, content links are mostly new, spelled in every usual way
+    rnd = random.Random(seed)
+    nav = [f'/category/{i}/' for i in range(40)] + ['/', '/about.html', '../index.html', './list.html?page=2']
+    out = []
+    for i in range(pages):
+        base = f'https://{DOMAIN}/post/{i // 100}/{i}.html'
+        hrefs = rnd.sample(nav, 30)
+        for _ in range(links - len(hrefs)):
+            n = rnd.randrange(10 ** 6)
+            hrefs.append(rnd.choice([f'/post/{n // 100}/{n}.html', f'{n}.html', f'../{n // 100}/{n}.html?utm_source=x',
+                                     f'https://{DOMAIN}/post/{n // 100}/{n}.html#comments', f'//cdn.example.com/{n}.jpg']))
+        out.append((base, hrefs))
+    return out
+
+
+def legacy(url, hrefs):
+    links = []
+    up = urlparse(url)
+    idx = up.path.rfind('/')
+    up = up._replace(path=up.path[:idx + 1])
+    for href in hrefs:
+        u = urlparse(href)
+        if u.netloc == '' and not u.path.startswith('/'):
+            u = u._replace(netloc=up.netloc, path=up.path + u.path)
+        if (u.netloc != '' and u.netloc != DOMAIN) or u.scheme == 'javascript':
+            continue
+        if u.scheme == '':
+            u = u._replace(scheme='https')
+        if u.netloc == '':
+            u = u._replace(netloc=DOMAIN)
+        links.append(u._replace(params='', query='', fragment='').geturl())
+    return links
+
+
+def canonical(canonicalize):
+    def run(url, hrefs):
+        links = []
+        for href in hrefs:
+            link = canonicalize(url, href)
+            if link is not None and link.split('/', 3)[2] == DOMAIN:
+                links.append(link)
+        return links
+    return run
+
+
+def run(pages, f):
+    start = time.perf_counter()
+    n = 0
+    for base, hrefs in pages:
+        f(base, hrefs)
+        n += len(hrefs)
+    return n / (time.perf_counter() - start)
+
+
+def main(args):
+    pages = synthetic_links(*map(int, args))
+    print(f'{sum(len(h) for _, h in pages)} links on {len(pages)} pages')
+    cached = Canonicalizer()
+    for name, f in (('legacy', legacy), ('no cache', canonical(Canonicalizer(size=0))),
+                    ('cache', canonical(cached))):
+        print(f'{name:<10} {run(pages, f):>12,.0f} links/s')
+    info = cached.cache_info()
+    print(f'cache hit rate {info.hits / (info.hits + info.misses):.1%}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
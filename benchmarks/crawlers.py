@@ -0,0 +1,172 @@
+"""
+run every crawler class through main() against a synthetic site served locally and report
+pages/sec, MB/sec, peak RSS and CPU of the crawling process.
+usage: python benchmarks/crawlers.py [--pages 300] [--fanout 8] [--latency 0.01] [--errors 0.01] [--classes ...]
+the site is generated from *seed*, so two runs with the same arguments crawl the same pages.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PACKAGE = Path(__file__).resolve().parent.parent
+CLASSES = ('ImageCrawler', 'TextCrawler', 'ImageCrawlerMultiThread', 'TextCrawlerMultiThread',
+           'ImageCrawlerAsync', 'TextCrawlerAsync')
+IMAGE_CONTAINERS = [('div', {'class': 'content'}), ('img', {'src': True})]
+TEXT_CONTAINERS = [('div', {'class': 'content'}), ('p', {})]
+WORDS = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore'.split()
+
+
+class Site:
+    """
+    pages linking *fanout* random other pages, each showing *images* of a pool of *pool* images.
+    :param pages: number of pages, every one is reachable from page 0.
+    :param fanout: links per page.
+    :param images: images per page.
+    :param pool: distinct images, pages share them.
+    :param image_size: bytes per image.
+    :param paragraphs: paragraphs of text per page.
+    """
+
+    def __init__(self, pages=300, fanout=8, images=4, pool=200, image_size=20_000, paragraphs=20, seed=0):
+        rnd = random.Random(seed)
+        self.pages = {}
+        for i in range(pages):
+            # the next page is always linked, so the whole site is reachable
+            links = {(i + 1) % pages, *(rnd.randrange(pages) for _ in range(fanout - 1))}
+            nav = ''.join(f'<a href="p{j}.html">page {j}</a>' for j in sorted(links))
+            imgs = ''.join(f'<img src="img/{rnd.randrange(pool)}.jpg">' for _ in range(images))
+            text = ''.join(f'<p>{" ".join(rnd.choice(WORDS) for _ in range(rnd.randrange(20, 80)))}</p>'
+                           for _ in range(paragraphs))
+            self.pages[f'/p{i}.html'] = (f'<html><head><title>Page {i} - Bench</title></head><body>'
+                                         f'<nav>{nav}</nav><div class="content">{imgs}{text}</div></body></html>'
+                                         ).encode()
+        self.image_size = image_size
+
+    def get(self, path):
+        if path in self.pages:
+            return self.pages[path], 'text/html; charset=utf-8'
+        if path.startswith('/img/'):
+            return random.Random(path).randbytes(self.image_size), 'image/jpeg'
+        return None, None
+
+
+def serve(site_args, latency, jitter, errors, seed, ports):
+    """serve the site until killed, every response waits a log-normal latency, *errors* of them fail with 503."""
+    site = Site(seed=seed, **site_args)
+    rnd = random.Random(seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body go out in two writes, Nagle would hold the body for the client's delayed ack
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency * math.exp(rnd.gauss(0, jitter)))
+            body, kind = site.get(self.path)
+            code = 404 if body is None else 503 if rnd.random() < errors else 200
+            body = body if code == 200 else b''
+            self.send_response(code)
+            self.send_header('Content-Type', kind or 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def child(name, url, workers):
+    """crawl in this process, print what was crawled as json."""
+    import logging
+    sys.path.insert(0, str(PACKAGE))
+    import crawler
+    from metrics import Metrics
+    logging.getLogger('crawler').setLevel(logging.CRITICAL)  # injected errors are expected
+    logging.getLogger('storage').setLevel(logging.WARNING)
+    metrics = Metrics()
+    kwargs = {'max_workers': workers} if 'Thread' in name or 'Async' in name else {}
+    containers = IMAGE_CONTAINERS if 'Image' in name else TEXT_CONTAINERS
+    crawler.main(getattr(crawler, name), url, 'out', containers, ' - Bench', metrics=metrics, backoff=0.05,
+                 **kwargs)
+    print(json.dumps({'pages': metrics.value('crawler_stage_seconds', stage='parse'),
+                      'bytes': metrics.value('crawler_bytes_total')}))
+
+
+def measure(name, url, workers):
+    # a fresh directory per run, nothing is resumed
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, __file__, '--child', name, url, str(workers)], cwd=cwd,
+                                stdout=subprocess.PIPE, text=True)
+        out = proc.stdout.read()
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        return None
+    result = json.loads(out.strip().splitlines()[-1])
+    rss = usage.ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+    cpu = usage.ru_utime + usage.ru_stime
+    return result['pages'], seconds, result['bytes'], rss, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--fanout', type=int, default=8)
+    parser.add_argument('--images', type=int, default=4, help='images per page')
+    parser.add_argument('--pool', type=int, default=200, help='distinct images')
+    parser.add_argument('--image-size', type=int, default=20_000, help='bytes')
+    parser.add_argument('--latency', type=float, default=0.01, help='median seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.5, help='sigma of the log-normal latency')
+    parser.add_argument('--errors', type=float, default=0.01, help='share of responses failing with 503')
+    parser.add_argument('--workers', type=int, default=20, help='max_workers of threaded and async crawlers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--classes', nargs='+', default=CLASSES, choices=CLASSES)
+    args = parser.parse_args()
+    if args.child:
+        name, url, workers = args.child
+        return child(name, url, int(workers))
+
+    site_args = {'pages': args.pages, 'fanout': args.fanout, 'images': args.images, 'pool': args.pool,
+                 'image_size': args.image_size}
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, daemon=True,
+                                     args=(site_args, args.latency, args.jitter, args.errors, args.seed, ports))
+    server.start()
+    url = f'http://127.0.0.1:{ports.get()}/p0.html'
+    print(f'{args.pages} pages, fanout {args.fanout}, {args.images} images of {args.image_size} bytes per page, '
+          f'latency {args.latency}s, errors {args.errors:.0%}')
+    print(f'{"crawler":<24} {"pages":>6} {"seconds":>8} {"pages/s":>8} {"MB/s":>7} {"RSS MB":>7} {"CPU s":>6} '
+          f'{"CPU %":>6}')
+    try:
+        for name in args.classes:
+            result = measure(name, url, args.workers)
+            if result is None:
+                print(f'{name:<24} failed')
+                continue
+            pages, seconds, size, rss, cpu = result
+            print(f'{name:<24} {pages:>6} {seconds:>8.2f} {pages / seconds:>8.1f} {size / seconds / 2 ** 20:>7.2f} '
+                  f'{rss:>7.1f} {cpu:>6.2f} {cpu / seconds:>6.0%}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
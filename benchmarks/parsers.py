@@ -0,0 +1,56 @@
+"""
+measure pages/sec of every installed html parser backend, parsing full pages and partially.
+usage: python benchmarks/parsers.py [html files ...], synthetic pages are used when no file is given.
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
+
+BACKENDS = ('html.parser', 'lxml', 'html5lib')
+CONTAINERS = [('div', {'class': 'content'}), ('img', {'src': True})]
+
+
+def synthetic_pages(n=200, links=150, images=20, seed=0):
+    rnd = random.Random(seed)
+    pages = []
+    for i in range(n):
+        nav = ''.join(f'<li><a href="/page/{rnd.randrange(10 ** 6)}.html">item {j}</a></li>' for j in range(links))
+        body = ''.join(f'<p>{"lorem ipsum " * rnd.randrange(5, 40)}</p>' for _ in range(30))
+        imgs = ''.join(f'<img src="/img/{rnd.randrange(10 ** 6)}.jpg" alt="x">' for _ in range(images))
+        pages.append(f'<html><head><meta charset="utf-8"><title>Page {i} - Site</title>'
+                     f'<script>{"var a = 1;" * 200}</script></head><body><ul class="nav">{nav}</ul>'
+                     f'<div class="side">{body}</div><div class="content">{imgs}{body}</div></body></html>'.encode())
+    return pages
+
+
+def run(pages, parser, partial):
+    parse_only = SoupStrainer(['a', 'title', CONTAINERS[0][0]]) if partial else None
+    start = time.perf_counter()
+    for content in pages:
+        page = BeautifulSoup(content, parser, parse_only=parse_only)
+        page.find_all('a', href=True)
+        page.find('title')
+        for container in page.find_all(CONTAINERS[0][0], attrs=CONTAINERS[0][1]):
+            container.find_all(CONTAINERS[1][0], attrs=CONTAINERS[1][1])
+    return len(pages) / (time.perf_counter() - start)
+
+
+def main(files):
+    pages = [Path(f).read_bytes() for f in files] or synthetic_pages()
+    mb = sum(map(len, pages)) / 2 ** 20
+    print(f'{len(pages)} pages, {mb:.1f} MB')
+    print(f'{"backend":<12} {"full":>12} {"partial":>12}')
+    for parser in BACKENDS:
+        try:
+            full, part = run(pages, parser, False), run(pages, parser, True)
+        except FeatureNotFound:
+            print(f'{parser:<12} {"not installed":>12}')
+            continue
+        print(f'{parser:<12} {full:>8.1f} p/s {part:>8.1f} p/s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
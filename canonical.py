@@ -0,0 +1,142 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote
+
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+_SCHEME = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*:')
+_PERCENT = re.compile(r'%([0-9A-Fa-f]{2})')
+_DIGITS = re.compile(r'\d+')
+_UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+_SAFE = "/%:@!$&'()*+,;="
+_PLAIN = re.compile(r"[A-Za-z0-9/._~!$&'()*+,;=:@-]*").fullmatch
+
+
+def _fix_percent(m):
+    # decode escaped unreserved characters, upper case the remaining escapes
+    c = chr(int(m.group(1), 16))
+    return c if c in _UNRESERVED else '%' + m.group(1).upper()
+
+
+def _remove_dots(path):
+    segments = []
+    for seg in path.split('/')[1:]:
+        if seg == '..':
+            if segments:
+                segments.pop()
+        elif seg != '.':
+            segments.append(seg)
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/' + '/'.join(segments)
+
+
+@lru_cache(maxsize=1024)
+def _split_base(base):
+    return urlsplit(base)
+
+
+class Canonicalizer:
+    """
+    resolves a link against the page it was found on and normalises it per RFC 3986,
+    so different spellings of a page give the same url. results are kept in an LRU cache.
+    returns None for anything but http and https urls.
+    :param allow: names of query parameters kept, sorted, the others are dropped. None keeps every parameter.
+    :param size: max entries of the LRU cache.
+    """
+
+    def __init__(self, allow=(), size=100_000):
+        self.allow = None if allow is None else frozenset(allow)
+        self.size = size
+        self._cached = lru_cache(maxsize=size)(self._canonicalize)
+
+    def __reduce__(self):
+        # parse worker processes get a fresh cache
+        return type(self), (self.allow, self.size)
+
+    def __call__(self, base, href):
+        href = href.strip()
+        # narrow the base to the part the link depends on, so links repeated across pages hit the cache
+        if _SCHEME.match(href):
+            base = ''
+        elif href.startswith('//'):
+            base = base[:base.find(':') + 1]
+        elif href.startswith('/'):
+            i = base.find('/', base.find('//') + 2)
+            base = base if i < 0 else base[:i]
+        elif href[:1] not in ('', '?', '#'):
+            base = base.split('?', 1)[0]
+            i = base.rfind('/')
+            if i > base.find('//') + 1:
+                base = base[:i + 1]
+        return self._cached(base, href)
+
+    def _canonicalize(self, base, href):
+        try:
+            scheme, netloc, path, query, _ = urlsplit(href)
+            if not scheme:
+                # RFC 3986 5.2.2
+                b = _split_base(base)
+                scheme = b.scheme
+                if not netloc:
+                    netloc = b.netloc
+                    if not path:
+                        path = b.path
+                        query = query or b.query
+                    elif not path.startswith('/'):
+                        path = (b.path[:b.path.rfind('/') + 1] or '/') + path
+        except ValueError:
+            return None
+        if scheme not in DEFAULT_PORTS or not netloc:
+            return None
+        netloc = netloc.lower()
+        if netloc.endswith(DEFAULT_PORTS[scheme]):
+            netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+        if '/.' in path:
+            path = _remove_dots(path)
+        if '%' in path:
+            path = _PERCENT.sub(_fix_percent, path)
+        if not _PLAIN(path):
+            path = quote(path, safe=_SAFE)
+        if query and (self.allow is None or self.allow):
+            pairs = parse_qsl(query, keep_blank_values=True)
+            if self.allow is not None:
+                pairs = [(k, v) for k, v in pairs if k in self.allow]
+            query = urlencode(sorted(pairs))
+        else:
+            query = ''
+        return f'{scheme}://{netloc}{path or "/"}?{query}' if query else f'{scheme}://{netloc}{path or "/"}'
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+class Traps:
+    """
+    tells urls that look like crawler traps, endless calendars, session paths or links repeating their own path.
+    :param max_depth: max segments of a path.
+    :param max_repeats: max times one segment shows up in a path.
+    :param max_per_pattern: max urls added whose only difference is digits, such as calendar pages, None for no limit.
+    """
+
+    def __init__(self, max_depth=16, max_repeats=3, max_per_pattern=None):
+        self.max_depth = max_depth
+        self.max_repeats = max_repeats
+        self.max_per_pattern = max_per_pattern
+        self.patterns = Counter()
+
+    def check(self, url):
+        """return why canonical *url* looks like a trap, None if it does not."""
+        parts = url.split('?', 1)[0].split('/')[3:]
+        segments = [seg for seg in parts if seg]
+        if len(segments) > self.max_depth:
+            return 'path depth'
+        if len(segments) > self.max_repeats and max(Counter(segments).values()) > self.max_repeats:
+            return 'repeated segment'
+        if self.max_per_pattern is not None and self.patterns[_DIGITS.sub('0', url)] >= self.max_per_pattern:
+            return 'url pattern'
+        return None
+
+    def add(self, url):
+        if self.max_per_pattern is not None:
+            self.patterns[_DIGITS.sub('0', url)] += 1
@@ -1,143 +1,659 @@
+import hashlib
 import json
+import os
+import shutil
+from email.utils import parsedate_to_datetime
+from functools import partial
+from itertools import chain, repeat
 from urllib.parse import urlparse
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+import multiprocessing
 import asyncio
+import queue
+import threading
+import time
 
-from bs4 import BeautifulSoup, element
+from bs4 import BeautifulSoup, SoupStrainer, element
 import httpx
-from fake_useragent import UserAgent
-from tenacity import retry, stop_after_attempt
 
+from archive import ResponseArchive, TextArchive, read_member
+from canonical import Canonicalizer, Traps
 from coloredlogger import coloredlogger
 from constants import ILLEGAL_CHARACTERS
+from frontier import MemoryFrontier
+from governor import Bandwidth, Governor
+from journal import Journal, JournalDict, write_records
+from metrics import Metrics
+from recrawl import Recrawl
+from scheduler import Scheduler
+from sitemap import parse_sitemap, parse_robots, crawl_delay
+from storage import Manifest, Writer
+from transport import Transport
 
 logger = coloredlogger(__name__)
 
+# what one page yields: same site links, title parts, target values, the target attrs and the catalog
+Extraction = namedtuple('Extraction', ['links', 'title', 'targets', 'attr', 'catalog'])
 
-class Crawler:
 
-    attempt = 3
+# crawler shell living in each parse worker process of CrawlerAsync and of replay
+_worker = None
+
+
+def _init_worker(cls, state, containers):
+    global _worker
+    _worker = cls.__new__(cls)
+    _worker.__dict__.update(state)
+    _worker._strain(containers)
+
+
+def _scrape_bytes(content, encoding, url, containers, redundant):
+    # the parent process records the stage timings
+    start = time.perf_counter()
+    page = BeautifulSoup(content, _worker.parser, from_encoding=encoding, parse_only=_worker.parse_only)
+    parsed = time.perf_counter()
+    ex = _worker._extract(url, page, containers, redundant)
+    return ex, parsed - start, time.perf_counter() - parsed
+
+
+def _replay_record(location, containers, redundant):
+    # the worker reads and decompresses the record itself, only its location is sent
+    url, file, offset, length = location
+    r = ResponseArchive.parse(read_member(file, offset, length))
+    return (url, *_scrape_bytes(r.content, r.charset_encoding, url, containers, redundant))
+
+
+def _error_class(e):
+    if isinstance(e, httpx.HTTPStatusError):
+        code = e.response.status_code
+        return str(code) if code == httpx.codes.TOO_MANY_REQUESTS else f'{code // 100}xx'
+    return type(e).__name__
+
+
+def _matcher(name, attrs):
+    # bs4 matches a container like find_all(name, attrs) does, matches_tag replaced search_tag in bs4 4.13
+    strainer = SoupStrainer(name, attrs)
+    return getattr(strainer, 'matches_tag', None) or strainer.search_tag
+
 
-    def __init__(self, url, root, *, limits=100, timeout=5, **kwargs):
+def _retry_after(resp):
+    # seconds or an http date, None if absent or unreadable
+    value = resp.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class Crawler:
 
-        u = urlparse(url)
-        if u.scheme == '':
-            u = u._replace(scheme='https')
-        url = u.geturl()
-        self.domain = u.netloc
+    worker_attrs = ('domain', 'root', 'parser', 'partial', 'canonical')  # attributes parse workers need for _extract
+
+    attempt = 3
+    keep_tags = ()  # extra tags catalog() needs when parsing partially
+
+    def __init__(self, url, root, *, limits=100, timeout=5, frontier=None, compact_every=100_000,
+                 delay=0.0, max_per_host=None, backoff=1.0, breaker=5, breaker_pause=60.0, cache=False,
+                 parser='html.parser', partial=False, query=(), traps=None, metrics=None, robots=True,
+                 sitemaps=False, writer=None, rebuild_manifest=False, responses=False,
+                 recrawl=False, **kwargs):
+
+        self.canonical = Canonicalizer(allow=query)
+        self.traps = Traps() if traps is None else traps
+        if '://' not in url:
+            url = 'https://' + url
+        url = self.canonical(url, url)
+        self.domain = url.split('/', 3)[2]
+        self.start = url
         self.root = Path(root, self.domain)
-        self.data = Path(self.domain).with_suffix('.json')
-        self.limits = httpx.Limits(max_connections=limits,
-                                   max_keepalive_connections=limits // 5,
-                                   keepalive_expiry=5.0)
-        self.session = httpx.Client(limits=self.limits,
-                                    timeout=httpx.Timeout(timeout=timeout),
-                                    **kwargs)
+        self.data = self._state()
+        self.session = self._client(limits, timeout, **kwargs)
+
+        self.journal = Journal(self.data.with_suffix('.journal'))
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._compactor = None
+        self.writing = set()
+        # url -> [work left, depth] of pages being crawled, a page is journaled explored once its writes are done
+        self.unfinished = {}
+        self.restored = set()  # unfinished pages put back for a retry, they are not journaled explored
+
+        self.frontier = MemoryFrontier() if frontier is None else frontier
+        self.scheduler = Scheduler(self.frontier, self.priority, delay=delay, max_per_host=max_per_host,
+                                   attempts=self.attempt, backoff=backoff, breaker=breaker, pause=breaker_pause)
+        self.cache = JournalDict(self.data.with_suffix('.cache')) if cache else None
+        self.validated = {}  # url -> cache entry of pages being crawled, cached once done
+        self.parser = parser
+        self.partial = partial
+        self.parse_only = None
+        self.is_container = None
+        self.metrics = Metrics() if metrics is None else metrics
+        self.obey_robots = robots
+        self.robots = None
+        self.sitemaps = sitemaps
+        self.lastmods = JournalDict(self.data.with_suffix('.sitemaps')) if sitemaps else None
+        self.writer = Writer(metrics=self.metrics) if writer is None else writer
+        # files stored so far, looked up instead of stat
+        self.manifest = Manifest(self.data.with_suffix('.manifest'), self.root, rebuild=rebuild_manifest,
+                                 compact_every=compact_every)
+        # raw pages kept for replay
+        if responses is True:
+            responses = ResponseArchive(self.data.with_suffix('.warc'), compact_every=compact_every)
+        self.responses = None if responses is False or responses is None else responses
+        self.offline = False
+        # visit history, explored pages due for a revisit are fetched again
+        if recrawl is True:
+            recrawl = Recrawl(self.data.with_suffix('.visits'), compact_every=compact_every)
+        self.recrawl = None if recrawl is False or recrawl is None else recrawl
+        self.refreshing = set()  # pages fetched again, their outputs are replaced
 
         # check if the site crawled before, if then start from arbitrary url.
-        try:
-            with self.data.open('r') as f:
-                d = json.load(f)
-                self.urls = set(d['urls'])
-                self.explored = set(d['explored'])
-        except FileNotFoundError:
-            self.urls = {url}
-            self.explored = set()
+        self._resume(url)
+
+    def _client(self, limits, timeout, **kwargs):
+        return Transport(limits=limits, timeout=timeout, **kwargs)
+
+    def _state(self):
+        # the snapshot, the journal and the caches are named after it, that is after the whole domain.
+        # older versions kept the domain up to its last dot, example.com and example.org shared example.snapshot,
+        # state they left is still resumed
+        data = Path(f'{self.domain}.snapshot')
+        legacy = Path(self.domain).with_suffix('.snapshot')
+        if not self._has_state(data) and self._has_state(legacy):
+            return legacy
+        return data
+
+    @staticmethod
+    def _has_state(data):
+        return any(p.exists() for p in (data, data.with_suffix('.journal'), data.with_suffix('.json')))
 
     def crawl(self, containers, redundant=None):
 
-        while self.urls:
-            url = self.urls.pop()
-            if url in self.explored:
+        self._strain(containers)
+        self._prepare()
+        while self.scheduler:
+            url = self._next_url()
+            if url is None:
+                time.sleep(self.scheduler.wait_time() or 0)
                 continue
             self._crawl_one(url, containers, redundant)
 
     def _crawl_one(self, url, containers, redundant):
 
         self._log(url)
-        self.explored.add(url)
-        page = self._get(url, url, self._parse_html)
-        if page:
-            self._preprocess(url, page, containers, redundant)
-
-    def _parse_html(self, resp):
-        return BeautifulSoup(resp.text, 'html.parser')
-
-    def _preprocess(self, url, page, containers, redundant):
-
-        self._update_links(url, page)  # update links in current page
-        title = self._get_title(page, redundant)  # get title
-        targets, child_attr = self._get_target(page, containers)  # get targets
-        cat = self.catalog(page)  # get catalog
-        store_path = [cat] + title
-        if targets:
-            self.post_process(url, targets, store_path, child_attr)
-
-    @retry(stop=stop_after_attempt(attempt))
-    def _get(self, url, ori_url, f, *args):
-        self.session.headers = {'User-Agent': UserAgent().random,
-                                "Accept-Encoding": "*",
-                                "Connection": "keep-alive"
-                                }
+        self._explore(url)
         try:
-            r = self.session.get(url)
-            r.raise_for_status()
-        except httpx.RequestError as e:
-            logger.error("An error occurred while requesting %s. %s will be restored.",
-                         e.request.url, ori_url)
-            self._restore_url(ori_url)
-        except httpx.HTTPStatusError as e:
-            logger.error("Error response %s while requesting %s. %s will be discarded",
-                         e.response.status_code, e.request.url, ori_url)
+            if not self._allowed(url):
+                return
+            ex = self._get(url, url, self._scrape, url, containers, redundant, headers=self._validators(url))
+            if ex:
+                self._process(url, ex)
+        finally:
+            self._release(url)
+            self._done(url)
+
+    def _scrape(self, resp, url, containers, redundant):
+        page = self._parse_html(resp, url)
+        if page is not None:
+            with self.metrics.time('crawler_stage_seconds', stage='extract'):
+                return self._extract(url, page, containers, redundant)
+
+    def _extract(self, url, page, containers, redundant):
+        # a single walk over the tree collects anchors, the title and candidate containers
+        (parent_tag, attrs), (child_tag, child_attr) = containers[0], containers[1]
+        is_container = self.is_container or _matcher(parent_tag, attrs)
+        hrefs, title, parents = [], None, []
+        for tag in page.find_all(lambda t: t.name in ('a', 'title') or is_container(t)):
+            if tag.name == 'a' and tag.has_attr('href'):
+                hrefs.append(tag['href'])
+            if tag.name == 'title' and title is None:
+                title = tag.text
+            if is_container(tag):
+                parents.append(tag)
+        targets = None
+        for parent in parents:
+            targets = parent.find_all(child_tag, attrs=child_attr)
+            if targets:
+                break
+        return Extraction(self._links(url, hrefs),
+                          self._clean_title(title, redundant),
+                          self._values(targets, child_attr) if targets else None,
+                          child_attr,
+                          self.catalog(page))
+
+    def _process(self, url, ex):
+        self._update_links(url, ex.links)
+        if ex.targets:
+            self.post_process(url, ex.targets, [ex.catalog] + ex.title, ex.attr)
+
+    def _values(self, targets, attr):
+        return targets
+
+    def _parse_html(self, resp, url=None):
+        if url and self._not_modified(url, resp):
+            logger.info('Not modified %s, skip parsing', url)
+            return None
+        # parse bytes so the parser sniffs the charset, the http header one goes first
+        with self.metrics.time('crawler_stage_seconds', stage='parse'):
+            return BeautifulSoup(resp.content, self.parser, from_encoding=resp.charset_encoding,
+                                 parse_only=self.parse_only)
+
+    def _strain(self, containers):
+        parent_tag, attrs = containers[0]
+        self.is_container = _matcher(parent_tag, attrs)
+        # partial parsing only builds anchors, title, the containers and keep_tags
+        self.parse_only = None
+        if self.partial:
+            names = list(parent_tag) if isinstance(parent_tag, (list, tuple, set)) else [parent_tag]
+            self.parse_only = SoupStrainer(['a', 'title', *names, *self.keep_tags])
+
+    def _validators(self, url):
+        # an entry is cached once its page is done, it tells the content every output was made of
+        meta = self.cache.get(url) if self.cache is not None else None
+        if not meta:
+            return None
+        headers = {}
+        if meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def _not_modified(self, url, resp):
+        if self.cache is None and self.recrawl is None:
+            return False
+        digest = None if resp.status_code == 304 else hashlib.blake2b(resp.content, digest_size=16).hexdigest()
+        unchanged = False
+        if self.recrawl is not None:
+            changed = self.recrawl.visit(url, digest)
+            # only a revisit is skipped when unchanged, a page fetched again for a retry is parsed
+            if url in self.refreshing:
+                unchanged = not changed
+                self.metrics.inc('crawler_revisits_total', changed=str(changed).lower())
+        if self.cache is not None and digest is not None:
+            old = self.cache.get(url)
+            with self.lock:
+                self.validated[url] = {'etag': resp.headers.get('ETag'),
+                                       'last_modified': resp.headers.get('Last-Modified'),
+                                       'hash': digest}
+            unchanged = unchanged or old is not None and old['hash'] == digest
+        return unchanged or digest is None
+
+    def _get(self, url, ori_url, f, *args, headers=None):
+        try:
+            start = time.perf_counter()
+            r = self.session.get(url, headers=headers)
+            self._fetched(r, 'page', time.perf_counter() - start)
+            if r.status_code != httpx.codes.NOT_MODIFIED:
+                r.raise_for_status()
         except Exception as e:
-            logger.exception('%s happens %s', url, e)
-            # if error, restore unfinished url
-            self._restore_url(ori_url)
+            self._on_error(e, url, ori_url)
         else:
-            r.encoding = 'utf-8'
+            self._succeed(url)
+            if self._keeps(r):
+                self._submit(url, self._keep_response, url, r)
             return f(r, *args)
 
-    def _update_links(self, url, page):
-
-        links = page.find_all('a', href=True)
-        up = urlparse(url)
-        idx = up.path.rfind('/')
-        up = up._replace(path=up.path[:idx+1])
+    def _refreshes(self, url):
+        # outputs of a page fetched again or replayed are replaced, the new extraction may differ
+        return self.offline or url in self.refreshing
+
+    def _keeps(self, r):
+        return self.responses is not None and r.status_code == httpx.codes.OK
+
+    def _keep_response(self, url, r):
+        self.metrics.inc('crawler_disk_bytes_total', self.responses.add(url, r))
+
+    def replay(self, containers, redundant=None, processes=None):
+        """
+        extract every page of the response archive again and post process it like a crawl does, in *processes*
+        worker processes, one per core by default. nothing is fetched and no link is followed.
+        """
+        for url, ex in self._replayed(containers, redundant, processes):
+            if ex.targets:
+                self.post_process(url, ex.targets, [ex.catalog] + ex.title, ex.attr)
+
+    def _replayed(self, containers, redundant, processes):
+        if self.responses is None:
+            raise ValueError('replay needs the responses archive of a crawl')
+        self._strain(containers)
+        self.offline = True
+        state = {attr: getattr(self, attr) for attr in self.worker_attrs}
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(self._worker_type(), state, containers)) as pool:
+            for url, ex, parse, extract in pool.map(_replay_record, self.responses.locations(), repeat(containers),
+                                                    repeat(redundant), chunksize=64):
+                self.metrics.observe('crawler_stage_seconds', parse, stage='parse')
+                self.metrics.observe('crawler_stage_seconds', extract, stage='extract')
+                logger.info('Replaying %s', url)
+                yield url, ex
+
+    def _worker_type(self):
+        return type(self)
+
+    def _fetched(self, r, kind, seconds):
+        self.metrics.observe('crawler_stage_seconds', seconds, stage='fetch')
+        self.metrics.inc('crawler_bytes_total', r.num_bytes_downloaded, kind=kind)
+        self.metrics.inc('crawler_responses_total', code=r.status_code)
+
+    def _on_error(self, e, url, ori_url):
+        self.metrics.inc('crawler_errors_total', host=urlparse(url).netloc, error=_error_class(e))
+        retry_after = None
+        if isinstance(e, httpx.RequestError):
+            logger.error("An error occurred while requesting %s. %s will be retried.",
+                         e.request.url, ori_url)
+            self._fail(url)
+        elif isinstance(e, httpx.HTTPStatusError):
+            code = e.response.status_code
+            if code != httpx.codes.TOO_MANY_REQUESTS and code < 500:
+                logger.error("Error response %s while requesting %s. %s will be discarded",
+                             code, e.request.url, ori_url)
+                return
+            logger.error("Error response %s while requesting %s. %s will be retried",
+                         code, e.request.url, ori_url)
+            self._fail(url)
+            retry_after = _retry_after(e.response)
+        else:
+            logger.exception('%s happens %s', url, e)
+        # if error, retry unfinished url later
+        self._restore_url(ori_url, retry_after)
+
+    def _succeed(self, url):
+        with self.lock:
+            self.scheduler.succeed(url)
+
+    def _fail(self, url):
+        with self.lock:
+            paused = self.scheduler.fail(url)
+        if paused:
+            logger.warning('Too many failures on %s, pausing it for %d seconds',
+                           urlparse(url).netloc, self.scheduler.pause)
+
+    def _links(self, url, hrefs):
+        links = []
+        for href in hrefs:
+            link = self.canonical(url, href)
+            # canonical urls always read scheme://netloc/...
+            if link is not None and link.split('/', 3)[2] == self.domain:
+                links.append(link)
+        return links
+
+    def _update_links(self, url, links):
+        self._add_links(links, self.scheduler.depth(url) + 1)
+
+    def _add_links(self, links, depth):
         for link in links:
-            href = link['href']
-            u = urlparse(href)
-            if u.netloc == '' and not u.path.startswith('/'):
-                u = u._replace(netloc=up.netloc, path=up.path + u.path)
-            if (u.netloc != '' and u.netloc != self.domain) or u.scheme == 'javascript':
+            self._add_url(link, depth)
+
+    def _revisit(self, links):
+        # explored pages to fetch again go back to pending
+        with self.lock:
+            for url in links:
+                if url in self.frontier:
+                    self.frontier.restore(url, 0)
+                    self.journal.append('r', url, 0)
+                    self.refreshing.add(url)
+        self._maybe_compact()
+
+    def _prepare(self):
+        steps = self._bootstrap()
+        try:
+            url = next(steps)
+            while True:
+                url = steps.send(self._fetch(url))
+        except StopIteration:
+            pass
+
+    def _fetch(self, url):
+        try:
+            return self.session.get(url)
+        except httpx.HTTPError as e:
+            logger.warning('Cannot fetch %s, %s', url, e)
+            return None
+
+    def _bootstrap(self):
+        # yields the urls to fetch and is sent their responses, so sync and async crawlers share it
+        origin = '/'.join(self.start.split('/', 3)[:3])
+        if self.recrawl is not None:
+            due = self.recrawl.due()
+            self._revisit(due)
+            logger.info('Revisiting %d of %d pages', len(due), len(self.recrawl))
+        if self.obey_robots:
+            self._obey((yield f'{origin}/robots.txt'))
+        if not self.sitemaps:
+            return
+        if self.sitemaps is True:
+            sitemaps = (self.robots and self.robots.site_maps()) or [f'{origin}/sitemap.xml']
+        else:
+            sitemaps = self.sitemaps
+        todo, seen = [(url, None) for url in sitemaps], set()
+        while todo:
+            url, lastmod = todo.pop()
+            if url in seen:
                 continue
-            href = self._parse_url(u)
-            if href not in self.explored:
-                self.urls.add(href)
-
-    def _parse_url(self, parsed_url):
-        if parsed_url.scheme == '':
-            parsed_url = parsed_url._replace(scheme='https')
-        if parsed_url.netloc == '':  # convert relative url to absolute url
-            parsed_url = parsed_url._replace(netloc=self.domain)
-        parsed_url = parsed_url._replace(params='', query='', fragment='')
-        return parsed_url.geturl()
-
-    def _restore_url(self, url):
-        self.urls.add(url)
-        self.explored.discard(url)
+            seen.add(url)
+            r = yield url
+            if r is None or r.status_code != httpx.codes.OK:
+                logger.warning('Skipping sitemap %s', url)
+                continue
+            pages = []
+            for kind, loc, mod in parse_sitemap(r.content):
+                loc = self.canonical(loc, loc)
+                if loc is None:
+                    continue
+                if kind == 'sitemap':
+                    # a nested sitemap that did not change since the last crawl is not fetched
+                    if mod is None or self.lastmods.get(loc) != mod:
+                        todo.append((loc, mod))
+                elif loc.split('/', 3)[2] == self.domain:
+                    pages.append((loc, mod))
+            self._seed(pages)
+            logger.info('Seeded %d urls from sitemap %s', len(pages), url)
+            if lastmod is not None:
+                self.lastmods[url] = lastmod
+
+    def _seed(self, pages):
+        new, changed = [], []
+        for url, lastmod in pages:
+            old = self.lastmods.get(url)
+            if lastmod is not None and old == lastmod:
+                continue
+            (new if old is None else changed).append(url)
+            if lastmod is not None:
+                self.lastmods[url] = lastmod
+        self._add_links(new, 0)
+        self._revisit(changed)
+
+    def _obey(self, r):
+        self.robots = parse_robots(r.status_code if r is not None else 404, r.text if r is not None else '')
+        delay = crawl_delay(self.robots)
+        if delay:
+            logger.info('robots.txt asks for %.1f seconds between requests', delay)
+            self._slow_down(delay)
+
+    def _slow_down(self, delay):
+        with self.lock:
+            self.scheduler.set_delay(self.domain, delay)
+
+    def _allowed(self, url):
+        if self.robots is None or self.robots.can_fetch('*', url):
+            return True
+        logger.info('Skipping %s, disallowed by robots.txt', url)
+        return False
+
+    def _next_url(self):
+        with self.lock:
+            return self.scheduler.next()
+
+    def _release(self, url):
+        with self.lock:
+            self.scheduler.release(url)
+
+    def _claim(self, p):
+        # the same file may come from two pages or twice from one, only the first claim writes p
+        with self.lock:
+            if p in self.writing:
+                return False
+            self.writing.add(p)
+            return True
+
+    def _add_url(self, url, depth=0):
+        if self.robots is not None and not self.robots.can_fetch('*', url):
+            return
+        with self.lock:
+            trap = self.traps.check(url)
+            if trap is not None:
+                logger.debug('Skipping %s, %s looks like a crawler trap', url, trap)
+                return
+            if not self.frontier.add(url, depth):
+                return
+            self.traps.add(url)
+            self.journal.append('a', url, depth)
+        self._maybe_compact()
+
+    def _explore(self, url):
+        # explored in memory at once, in the journal once done, so a page lost to a kill is fetched again
+        with self.lock:
+            depth = self.scheduler.depth(url)
+            self.frontier.explore(url)
+            self.unfinished.setdefault(url, [0, depth])[0] += 1
+            self.restored.discard(url)
+
+    def _hold(self, url):
+        # one more piece of work the page waits for, a replayed page is not being crawled and waits for none
+        with self.lock:
+            if url in self.unfinished:
+                self.unfinished[url][0] += 1
+
+    def _done(self, url):
+        with self.lock:
+            work = self.unfinished.get(url)
+            if work is None:
+                return
+            work[0] -= 1
+            if work[0]:
+                return
+            del self.unfinished[url]
+            if url in self.restored:
+                self.restored.discard(url)
+                self.validated.pop(url, None)
+                return
+            self.scheduler.finish(url)
+            self.journal.append('e', url)
+            meta = self.validated.pop(url, None)
+        if meta is not None:
+            self.cache[url] = meta
+        self._maybe_compact()
+
+    def _submit(self, url, fn, *args):
+        # a write handed to the writer is part of its page
+        self._hold(url)
+        return self.writer.submit(self._write_for, url, fn, args)
+
+    def _write_for(self, url, fn, args):
+        try:
+            fn(*args)
+        finally:
+            self._done(url)
+
+    def _restore_url(self, url, retry_after=None):
+        # the url stays explored in memory until its backoff expires, the journal already has it pending
+        with self.lock:
+            depth = self.scheduler.depth(url)
+            if self.scheduler.retry(url, retry_after) is None:
+                logger.error('%s failed %d times, discarded', url, self.attempt)
+                return
+            self.journal.append('r', url, depth)
+            if url in self.unfinished:
+                self.restored.add(url)
+        self._maybe_compact()
+
+    def _resume(self, url):
+        legacy = self.data.with_suffix('.json')
+        if self.data.exists():
+            for record in Journal(self.data).replay():
+                self._apply(*record)
+        elif legacy.exists():
+            with legacy.open('r') as f:
+                d = json.load(f)
+            for u in d['urls']:
+                self.frontier.add(u)
+            for u in d['explored']:
+                self.frontier.explore(u)
+        elif url is not None:
+            self.frontier.add(url)
+        # replay an unfinished compaction first, then records since the last snapshot
+        old = Journal(self.journal.path.with_name(self.journal.path.name + '.1'))
+        for journal in (old, self.journal):
+            for record in journal.replay():
+                self._apply(*record)
+
+    def _apply(self, op, value, depth=0):
+        if op == 'a':
+            self.frontier.add(value, depth)
+        elif op == 'e':
+            self.frontier.explore(value)
+        elif op == 'x':
+            self.frontier.explore_fingerprint(value)
+        elif op == 'r':
+            self.frontier.restore(value, depth)
+
+    def _maybe_compact(self):
+        # the snapshot is rewritten on a thread of its own, fetches and the event loop never wait for it
+        if self.journal.count >= self.compact_every and self._compacting.acquire(blocking=False):
+            self._compactor = threading.Thread(target=self._compact, name='compactor')
+            self._compactor.start()
+
+    def compact(self):
+        """fold the journal into the snapshot, after a compaction running in the background."""
+        self._compacting.acquire()
+        self._compact()
+
+    def _compact(self):
+        try:
+            with self.lock:
+                # pages not done yet go back to pending, the snapshot has them explored
+                unfinished = [('r', url, depth) for url, (_, depth) in self.unfinished.items()]
+                records = chain(self.frontier.snapshot(), self.scheduler.snapshot(), unfinished)
+                old = self.journal.rotate()
+            write_records(self.data, records)
+            old.unlink(missing_ok=True)
+            self.data.with_suffix('.json').unlink(missing_ok=True)
+        finally:
+            self._compacting.release()
 
     def store(self):
-        d = {'urls': list(self.urls), 'explored': list(self.explored)}
-        with self.data.open('w') as f:
-            json.dump(d, f)
-
-    def _get_title(self, html, redundant):
-        title = html.find('title')
+        # files of explored urls are on disk before the journal says so
+        self.writer.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+        self.journal.flush()
+        if self.cache is not None:
+            self.cache.flush()
+        if self.lastmods is not None:
+            self.lastmods.flush()
+        if self.recrawl is not None:
+            self.recrawl.flush()
+        self.manifest.flush()
+        if self.responses is not None:
+            self.responses.flush()
+        self._gauges()
+        self.metrics.write()
+
+    def _is_stored(self, p):
+        return p in self.manifest
+
+    def _clean_title(self, title, redundant):
         extras = ' -_.'
         if not title:
             return ['no title']
-        title = title.text
         for ic in ILLEGAL_CHARACTERS:
             title = title.replace(ic, '')
         if redundant:
@@ -148,22 +664,22 @@ class Crawler:
     def custom_title(self, title):
         return [title]
 
-    def _get_target(self, html, containers):
-        parent_tag, attrs = containers[0]
-        contents = html.find_all(parent_tag, attrs=attrs)
-        child_tag, attr_child = containers[1]
-        if contents:
-            for content in contents:
-                targets = content.find_all(child_tag, attrs=attr_child)
-                if targets:
-                    return targets, attr_child
-        return None, attr_child
+    def priority(self, url, depth):
+        return depth
 
     def catalog(self, html):
         return ''
 
     def _log(self, url):
-        logger.info('Crawling %s, remaining %d, finished %d', url, len(self.urls), len(self.explored))
+        logger.info('Crawling %s, remaining %d, finished %d', url, len(self.scheduler), self.frontier.explored_count)
+        self._gauges()
+        self.metrics.maybe_write()
+
+    def _gauges(self):
+        # labelled by site, the sites of crawl_sites share one Metrics
+        self.metrics.set('crawler_queue_depth', len(self.scheduler), site=self.domain)
+        self.metrics.set('crawler_pages_inflight', len(self.scheduler.inflight), site=self.domain)
+        self.metrics.set('crawler_explored', self.frontier.explored_count, site=self.domain)
 
     def post_process(self, *args):
         raise NotImplemented
@@ -171,51 +687,238 @@ class Crawler:
 
 class ImageCrawler(Crawler):
 
+    chunk_size = 1 << 16
+
+    def __init__(self, url, root, *, blobs=None, **kwargs):
+        super().__init__(url, root, **kwargs)
+        # one file per distinct content, images under store_path are hard links to it
+        self.blobs = Path(root, '.blobs') if blobs is None else Path(blobs)
+        self.images = JournalDict(self.data.with_suffix('.images'), compact_every=self.compact_every)
+
     def post_process(self, url, srcs, store_path, attr):
 
         for src in srcs:
             self._save(url, src, attr, store_path)
 
     def _save(self, url, src, attr, store_path):
-        src, p = self._pre_prepare(src, attr, store_path)
-        if not p.exists():
-            self._get(src, url, self._write, p)
+        src, p = self._pre_prepare(url, src, attr, store_path)
+        if src is not None and not self._is_stored(p) and not self._link_known(src, p) and self._fetchable(src) \
+                and self._claim(p):
+            kept = False
+            try:
+                kept = self._download(src, url, p)
+            finally:
+                # a kept image is released by the writer once it is in place
+                if not kept:
+                    self.writing.discard(p)
+
+    def _blob(self, digest):
+        return Path(self.blobs, digest[:2], digest)
+
+    def _fetchable(self, src):
+        if self.offline:
+            logger.info('Skipping %s, replay fetches nothing', src)
+            return False
+        return True
+
+    def _link_known(self, src, p):
+        # an image url fetched before needs no request, its blob is linked into place
+        digest = self.images.get(src)
+        if digest is None or not self._blob(digest).exists():
+            return False
+        self._link(self._blob(digest), p)
+        return True
+
+    def _keep(self, src, part, p, digest):
+        blob = self._blob(digest)
+        if blob.exists():
+            part.unlink()
+        else:
+            self.writer.mkdir(blob.parent)
+            os.replace(part, blob)
+            self.writer.track(blob)
+        self._validator(part).unlink(missing_ok=True)
+        self._link(blob, p)
+        self.writer.track(p)
+        self.images[src] = digest
+
+    def store(self):
+        super().store()
+        self.images.flush()
+
+    def _streamed(self, r, start, written):
+        # the stream time less the time spent writing is network time
+        self._fetched(r, 'image', time.perf_counter() - start - written)
 
-    def _pre_prepare(self, src, attr, store_path):
+    def _finish(self, src, part, p, digest, written):
+        # runs on a writer thread, moving the part to its blob and linking it need no fetch worker
+        t = time.perf_counter()
+        try:
+            self._keep(src, part, p, digest)
+        finally:
+            self.writing.discard(p)
+        self.metrics.observe('crawler_stage_seconds', written + time.perf_counter() - t, stage='write')
+
+    def _link(self, blob, p):
+        self.writer.mkdir(p.parent)
+        try:
+            os.link(blob, p)
+        except FileExistsError:
+            pass
+        except OSError:
+            # no hard links across devices or on this file system
+            shutil.copyfile(blob, p)
+        self.manifest.add(p)
+
+    @staticmethod
+    def _hasher(part, resumed):
+        # bytes already in a resumed part are hashed first, the rest while it streams
+        h = hashlib.blake2b(digest_size=16)
+        if resumed:
+            with part.open('rb') as f:
+                while chunk := f.read(1 << 20):
+                    h.update(chunk)
+        return h
+
+    def _values(self, targets, attr):
+        key = list(attr)[0]
+        return [target[key] for target in targets]
+
+    def _pre_prepare(self, url, src, attr, store_path):
         if isinstance(src, element.Tag):
             src = src[list(attr)[0]]
-        u = urlparse(src)
-        src = self._parse_url(u)
-        name = u.path.split('/')[-1]
+        name = urlparse(src).path.split('/')[-1]
+        src = self.canonical(url, src)
+        if src is None:
+            return None, None
         p = Path(self.root, *store_path, name)
         return src, p
 
-    def _write(self, resp, p):
-        p.parent.mkdir(parents=True, exist_ok=True)
-        logger.info('Writing image to %s', p)
-        p.write_bytes(resp.content)
+    def _download(self, src, ori_url, p):
+        # stream into p.part and move it to its blob when complete, a leftover p.part is resumed with a Range request
+        # made conditional on the validator kept next to it
+        part, headers = self._resume_part(p)
+        start, written = time.perf_counter(), 0.0
+        try:
+            with self.session.stream('GET', src, headers=headers) as r:
+                h, f = self._open_part(r, part)
+                if f is not None:
+                    logger.info('Writing image to %s', p)
+                    with f:
+                        for chunk in r.iter_bytes(self.chunk_size):
+                            h.update(chunk)
+                            written += self.writer.append(f, chunk)
+        except Exception as e:
+            self._on_error(e, src, ori_url)
+            return False
+        self._succeed(src)
+        self._streamed(r, start, written)
+        self._submit(ori_url, self._finish, src, part, p, h.hexdigest(), written)
+        return True
+
+    def _open_part(self, r, part):
+        # the hash of what part holds already and the file the rest goes to, None when the part is complete
+        if self._range_done(r, part):
+            return self._hasher(part, True), None
+        r.raise_for_status()
+        resumed = r.status_code == httpx.codes.PARTIAL_CONTENT
+        if resumed and not r.headers.get('Content-Range', '').startswith(f'bytes {part.stat().st_size}-'):
+            self._drop_part(part)
+            raise ValueError(f'{r.url} sent {r.headers.get("Content-Range")} for {part.name}, fetching it again')
+        if not resumed:
+            self._keep_validator(r, part)
+        return self._hasher(part, resumed), part.open('ab' if resumed else 'wb')
+
+    def _resume_part(self, p):
+        self.writer.mkdir(p.parent)
+        part = p.with_name(p.name + '.part')
+        size = part.stat().st_size if part.exists() else 0
+        if not size:
+            return part, None
+        try:
+            validator = self._validator(part).read_text()
+        except FileNotFoundError:
+            # nothing tells the part is of the image the server has now, it is fetched whole
+            return part, None
+        return part, {'Range': f'bytes={size}-', 'If-Range': validator}
+
+    @staticmethod
+    def _validator(part):
+        return part.with_name(part.name + '.validator')
+
+    def _keep_validator(self, r, part):
+        # a weak etag cannot make a range conditional
+        etag = r.headers.get('ETag')
+        validator = etag if etag and not etag.startswith('W/') else r.headers.get('Last-Modified')
+        if validator:
+            self._validator(part).write_text(validator)
+        else:
+            self._validator(part).unlink(missing_ok=True)
+
+    def _drop_part(self, part):
+        part.unlink(missing_ok=True)
+        self._validator(part).unlink(missing_ok=True)
+
+    def _range_done(self, r, part):
+        if r.status_code != httpx.codes.REQUESTED_RANGE_NOT_SATISFIABLE:
+            return False
+        if r.headers.get('Content-Range') == f'bytes */{part.stat().st_size}':
+            return True
+        self._drop_part(part)
+        return False
 
 
 class TextCrawler(Crawler):
 
+    def __init__(self, url, root, *, archive=False, **kwargs):
+        super().__init__(url, root, **kwargs)
+        # pages packed into compressed segments instead of a file each
+        if archive is True:
+            archive = TextArchive(Path(root, self.data.with_suffix('.archive').name), compact_every=self.compact_every)
+        self.archive = None if archive is False or archive is None else archive
+
     def post_process(self, url, paras, store_path, attr):
 
-        path, contents = self._pre_prepare(paras, store_path)
+        path, contents = self._pre_prepare(paras, store_path, refresh=self._refreshes(url))
         if path:
-            self._write(path, contents)
+            self._submit(url, self._write, path, contents)
 
-    def _pre_prepare(self, contents, store_path):
+    def _pre_prepare(self, contents, store_path, refresh=False):
         p = (Path(self.root, *store_path)).with_suffix('.txt')
-        if not p.exists():
-            p.parent.mkdir(parents=True, exist_ok=True)
-            contents = '\n    '.join(para.text for para in contents)
+        if (refresh or not self._is_stored(p)) and self._claim(p):
+            contents = '\n    '.join(contents)
             contents = f'# {"".join(store_path[1:])}\n\n    {contents}'
             return p, contents
         return None, None
 
+    def _values(self, targets, attr):
+        return [para.text for para in targets]
+
     def _write(self, path, contents):
-        logger.info('Saving %s to %s', path.stem, path)
-        path.write_text(contents, encoding='utf-8')
+        try:
+            with self.metrics.time('crawler_stage_seconds', stage='write'):
+                if self.archive is None:
+                    logger.info('Saving %s to %s', path.stem, path)
+                    self.writer.write(path, contents.encode('utf-8'))
+                    self.manifest.add(path)
+                else:
+                    key = self._key(path)
+                    logger.info('Packing %s into %s', path.stem, self.archive.path)
+                    size = self.archive.add(key, {'path': key, 'text': contents})
+                    self.metrics.inc('crawler_disk_bytes_total', size)
+        finally:
+            self.writing.discard(path)
+
+    def _key(self, p):
+        return p.relative_to(self.root).as_posix()
+
+    def _is_stored(self, p):
+        return super()._is_stored(p) if self.archive is None else self._key(p) in self.archive
+
+    def store(self):
+        super().store()
+        if self.archive is not None:
+            self.archive.flush()
 
 
 class CrawlerMultiThread(Crawler):
@@ -223,54 +926,63 @@ class CrawlerMultiThread(Crawler):
     def __init__(self, url, root, max_workers=5, **kwargs):
         super().__init__(url, root, **kwargs)
         self.max_workers = max_workers
+        self.tasks = queue.Queue(maxsize=max_workers)
+        self.changed = threading.Condition(self.lock)
+        self.active = 0  # urls handed out to workers and not finished yet
+        self.assets = None
 
     def crawl(self, containers, redundant=None):
-        while self.urls:
-            ttl = len(self.urls)
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                if ttl < self.max_workers:
-                    futures = [executor.submit(self._crawl_one, self.urls.pop(), containers, redundant)
-                               for _ in range(ttl)]
-                else:
-                    futures = [executor.submit(self._crawl_one, self.urls.pop(), containers, redundant)
-                               for _ in range(self.max_workers)]
-                try:
-                    while self.urls:
-                        for future in as_completed(futures):
-                            url = self.urls.pop()
-                            f = executor.submit(self._crawl_one, url, containers, redundant)
-                            futures.remove(future)
-                            futures.append(f)
-                except KeyboardInterrupt:
-                    logger.warning('Caught KeyboardInterrupt, stopping crawler now')
-                    self.session.close()
-                    break
-
-    def _preprocess(self, url, page, containers, redundant):
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            fs = [executor.submit(self._update_links, url, page),
-                  executor.submit(self._get_title, page, redundant),
-                  executor.submit(self._get_target, page, containers),
-                  executor.submit(self.catalog, page)]
-        for f in as_completed(fs):
-            res = f.result()
-            if isinstance(res, list):
-                title = res
-            elif isinstance(res, tuple):
-                targets, child_attr = res
-            elif isinstance(res, str):
-                cat = res
-        store_path = [cat] + title
-        if targets:
-            self.post_process(url, targets, store_path, child_attr)
+        self._strain(containers)
+        self._prepare()
+        workers = [threading.Thread(target=self._work, args=(containers, redundant), daemon=True)
+                   for _ in range(self.max_workers)]
+        for worker in workers:
+            worker.start()
+        self.assets = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while (url := self._dispatch()) is not None:
+                self.tasks.put(url)  # blocks while workers are busy
+        except KeyboardInterrupt:
+            logger.warning('Caught KeyboardInterrupt, stopping crawler now')
+            while not self.tasks.empty():
+                self.tasks.get_nowait()
+            self.session.close()
+        finally:
+            for _ in workers:
+                self.tasks.put(None)
+            for worker in workers:
+                worker.join()
+            self.assets.shutdown()
+
+    def _dispatch(self):
+        # next url for the workers, None once nothing is pending and nothing is in flight
+        with self.changed:
+            while True:
+                url = self.scheduler.next()
+                if url is not None:
+                    self.active += 1
+                    return url
+                if not self.active and not self.scheduler:
+                    return None
+                self.changed.wait(self.scheduler.wait_time())
+
+    def _work(self, containers, redundant):
+        while (url := self.tasks.get()) is not None:
+            try:
+                self._crawl_one(url, containers, redundant)
+            except Exception as e:
+                logger.exception('%s happens %s', url, e)
+            finally:
+                with self.changed:
+                    self.active -= 1
+                    self.changed.notify()
 
 
 class ImageCrawlerMultiThread(CrawlerMultiThread, ImageCrawler):
 
     def post_process(self, url, srcs, store_path, attr):
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            [executor.submit(self._save, url, src, attr, store_path) for src in srcs]
+        wait([self.assets.submit(self._save, url, src, attr, store_path) for src in srcs])
 
 
 class TextCrawlerMultiThread(CrawlerMultiThread, TextCrawler):
@@ -280,84 +992,141 @@ class TextCrawlerMultiThread(CrawlerMultiThread, TextCrawler):
 
 class CrawlerAsync(Crawler):
 
-    attempt = 3
-
-    def __init__(self, url, root, *, limits=100, timeout=5, max_workers=100, **kwargs):
-        super().__init__(url, root, limits=limits, timeout=timeout, **kwargs)
-        if max_workers > limits:
-            self.limits = httpx.Limits(max_connections=max_workers,
-                                       max_keepalive_connections=max_workers // 5,
-                                       keepalive_expiry=5.0)
+    def __init__(self, url, root, *, limits=100, timeout=5, max_workers=100, processes=None, governor=None,
+                 **kwargs):
+        super().__init__(url, root, limits=max(limits, max_workers), timeout=timeout, **kwargs)
         self.max_workers = max_workers
-        self.session = httpx.AsyncClient(limits=self.limits,
-                                         timeout=httpx.Timeout(timeout=timeout),
-                                         **kwargs)
+        self.governor = Governor(initial=max(1, max_workers // 4), maximum=max_workers) if governor is None \
+            else governor
+        self.processes = processes
+        self.pool = None
+
+    def _client(self, limits, timeout, **kwargs):
+        return Transport(asynchronous=True, limits=limits, timeout=timeout, **kwargs)
 
     async def crawl(self, containers, redundant=None):
 
-        while self.urls:
-            ttl = len(self.urls)
-            if ttl < self.max_workers:
-                pending = {asyncio.create_task(self._crawl_one(self.urls.pop(), containers, redundant))
-                           for _ in range(ttl)}
-            else:
-                pending = {asyncio.create_task(self._crawl_one(self.urls.pop(), containers, redundant))
-                           for _ in range(self.max_workers)}
-            try:
-                while pending:
-                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
-                    while done and self.urls:
-                        task = asyncio.create_task(self._crawl_one(self.urls.pop(), containers, redundant))
-                        pending.add(task)
-                        done.pop()
-            except asyncio.CancelledError:
-                await self.aclose()
-                await self.session.aclose()
-                break
+        self._strain(containers)
+        await self._prepare()
+        if self.processes:
+            state = {attr: getattr(self, attr) for attr in self.worker_attrs}
+            self.pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(self._worker_type(), state, containers))
+        pending = set()
+        try:
+            while self._more(pending):
+                while len(pending) < self.max_workers and (url := self._next_url()):
+                    pending.add(asyncio.create_task(self._crawl_one(url, containers, redundant)))
+                if not pending:
+                    await asyncio.sleep(self._wait() or 0)
+                    continue
+                _, pending = await asyncio.wait(pending, timeout=self._wait(), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            await self.aclose()
+            await self.session.aclose()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+                self.pool = None
+
+    async def _asubmit(self, url, fn, *args):
+        self._hold(url)
+        return await self.writer.asubmit(self._write_for, url, fn, args)
+
+    async def _prepare(self):
+        steps = self._bootstrap()
+        try:
+            url = next(steps)
+            while True:
+                url = steps.send(await self._fetch(url))
+        except StopIteration:
+            pass
+
+    async def _fetch(self, url):
+        try:
+            return await self.session.get(url)
+        except httpx.HTTPError as e:
+            logger.warning('Cannot fetch %s, %s', url, e)
+            return None
+
+    def _more(self, pending):
+        return bool(self.scheduler or pending)
+
+    def _wait(self):
+        # seconds the loop may block without missing work, None for until a fetch finishes
+        return self.scheduler.wait_time()
 
     async def _crawl_one(self, url, containers, redundant):
 
         self._log(url)
-        self.explored.add(url)
-        page = await self._get(url, url, self._parse_html)
-        if page:
-            results = await asyncio.gather(asyncio.to_thread(self._update_links, url, page),
-                                           asyncio.to_thread(self._get_title, page, redundant),
-                                           asyncio.to_thread(self._get_target, page, containers),
-                                           asyncio.to_thread(self.catalog, page))
-            _, t, (targets, child_attr), cat = results
-            store_path = [cat] + t
-            if targets:
-                await self.post_process(url, targets, store_path, child_attr)
-
-    @retry(stop=stop_after_attempt(attempt))
-    async def _get(self, url, ori_url, f, *args):
-        self.session.headers = {'User-Agent': UserAgent().random,
-                                "Accept-Encoding": "*",
-                                "Connection": "keep-alive"
-                                }
+        self._explore(url)
         try:
-            r = await self.session.get(url)
-            r.raise_for_status()
-        except httpx.RequestError as e:
-            logger.error("An error occurred while requesting %s. %s will be restored.",
-                         e.request.url, ori_url)
-            self._restore_url(ori_url)
-        except httpx.HTTPStatusError as e:
-            logger.error("Error response %s while requesting %s.",
-                         e.response.status_code, e.request.url)
+            if not self._allowed(url):
+                return
+            scrape = self._scrape if self.pool is None else self._scrape_in_pool
+            ex = await self._get(url, url, scrape, url, containers, redundant, headers=self._validators(url))
+            if ex:
+                await self._process(url, ex)
+        finally:
+            self._release(url)
+            self._done(url)
+
+    async def _scrape_in_pool(self, resp, url, containers, redundant):
+        # only bytes go to the worker and only the small Extraction comes back
+        if self._not_modified(url, resp):
+            logger.info('Not modified %s, skip parsing', url)
+            return None
+        loop = asyncio.get_running_loop()
+        ex, parse, extract = await loop.run_in_executor(self.pool, _scrape_bytes, resp.content,
+                                                        resp.charset_encoding, url, containers, redundant)
+        self.metrics.observe('crawler_stage_seconds', parse, stage='parse')
+        self.metrics.observe('crawler_stage_seconds', extract, stage='extract')
+        return ex
+
+    async def replay(self, containers, redundant=None, processes=None):
+        for url, ex in self._replayed(containers, redundant, processes):
+            if ex.targets:
+                await self.post_process(url, ex.targets, [ex.catalog] + ex.title, ex.attr)
+
+    async def _process(self, url, ex):
+        self._update_links(url, ex.links)
+        if ex.targets:
+            await self.post_process(url, ex.targets, [ex.catalog] + ex.title, ex.attr)
+
+    async def _get(self, url, ori_url, f, *args, headers=None):
+        try:
+            async with self.governor.slot() as slot:
+                start = time.perf_counter()
+                r = await self.session.get(url, headers=headers)
+                slot.observe(r.status_code)
+                self._fetched(r, 'page', time.perf_counter() - start)
+            if r.status_code != httpx.codes.NOT_MODIFIED:
+                r.raise_for_status()
         except Exception as e:
-            logger.error('%s happens %s', url, e)
-            # if error, restore unfinished url
-            self._restore_url(ori_url)
+            self._on_error(e, url, ori_url)
         else:
-            r.encoding = 'utf-8'
+            self._succeed(url)
+            if self._keeps(r):
+                await self._asubmit(url, self._keep_response, url, r)
+            if asyncio.iscoroutinefunction(f):
+                return await f(r, *args)
             result = asyncio.create_task(asyncio.to_thread(f, r, *args))
             return await result
 
     async def post_process(self, *args):
         raise NotImplemented
 
+    def _log(self, url):
+        logger.info('Crawling %s, remaining %d, finished %d, in flight %d of limit %d', url, len(self.scheduler),
+                    self.frontier.explored_count, self.governor.inflight, self.governor.limit)
+        self._gauges()
+        self.metrics.maybe_write()
+
+    def _gauges(self):
+        self.metrics.set('crawler_requests_inflight', self.governor.inflight, site=self.domain)
+        self.metrics.set('crawler_governor_limit', self.governor.limit, site=self.domain)
+        super()._gauges()
+
     async def aclose(self):
         logger.warning('Hold on, app is finishing remaining tasks...')
         loop = asyncio.get_running_loop()
@@ -369,26 +1138,120 @@ class CrawlerAsync(Crawler):
 
 class ImageCrawlerAsync(CrawlerAsync, ImageCrawler):
 
-    async def post_process(self, url, srcs, store_path, attr):
+    poll = 0.05  # seconds between two looks at the crawl loop while only images are downloading
+    write_size = 1 << 20  # bytes of a download gathered before a thread writes them
+
+    def __init__(self, url, root, *, limits=100, max_workers=100, asset_workers=None, asset_backlog=10_000,
+                 asset_governor=None, asset_bandwidth=None, **kwargs):
+        self.asset_workers = max_workers if asset_workers is None else asset_workers
+        # pages and images each get their own connections
+        super().__init__(url, root, limits=max(limits, max_workers + self.asset_workers), max_workers=max_workers,
+                         **kwargs)
+        self.asset_governor = Governor(initial=max(1, self.asset_workers // 4), maximum=self.asset_workers) \
+            if asset_governor is None else asset_governor
+        self.bandwidth = None if asset_bandwidth is None else Bandwidth(asset_bandwidth)
+        self.backlog = asyncio.Semaphore(asset_backlog)
+        self.assets = set()  # image downloads queued or running
+        self.fetching = {}  # src -> event set once its download is over
 
-        to_do = [self._save(url, src, attr, store_path)
-                 for src in srcs]
-        await asyncio.gather(*to_do)
+    async def post_process(self, url, srcs, store_path, attr):
+        # images are left to their own budget, the page task goes back to finding links
+        for src in srcs:
+            await self.backlog.acquire()
+            task = asyncio.create_task(self._save(url, src, attr, store_path))
+            self.assets.add(task)
+            # the page is done once its images are
+            self._hold(url)
+            task.add_done_callback(partial(self._saved, url))
+
+    def _saved(self, url, task):
+        self.assets.discard(task)
+        self.backlog.release()
+        self._done(url)
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            logger.error('Saving image failed, %s: %s', type(e).__name__, e)
+
+    def _more(self, pending):
+        # a failed image puts its page back, so the crawl goes on until every image is done
+        return super()._more(pending) or bool(self.assets)
+
+    def _wait(self):
+        wait = super()._wait()
+        return self.poll if self.assets and (wait is None or wait > self.poll) else wait
+
+    async def replay(self, containers, redundant=None, processes=None):
+        await super().replay(containers, redundant, processes)
+        while self.assets:
+            await asyncio.wait(set(self.assets))
+
+    def _gauges(self):
+        self.metrics.set('crawler_assets_queued', len(self.assets), site=self.domain)
+        self.metrics.set('crawler_assets_inflight', self.asset_governor.inflight, site=self.domain)
+        self.metrics.set('crawler_asset_limit', self.asset_governor.limit, site=self.domain)
+        super()._gauges()
 
     async def _save(self, url, src, attr, store_path):
-        src, p = self._pre_prepare(src, attr, store_path)
-        if not p.exists():
-            await self._get(src, url, self._write, p)
+        src, p = self._pre_prepare(url, src, attr, store_path)
+        if src is None or self._is_stored(p):
+            return
+        while (running := self.fetching.get(src)) is not None:
+            # the same image is on its way for another page, it is linked once kept
+            await running.wait()
+        if self._link_known(src, p) or not self._fetchable(src) or not self._claim(p):
+            return
+        self.fetching[src] = running = asyncio.Event()
+        kept = False
+        try:
+            kept = await self._download(src, url, p)
+        finally:
+            del self.fetching[src]
+            running.set()
+            if not kept:
+                self.writing.discard(p)
+
+    async def _download(self, src, ori_url, p):
+        # the part is looked up, opened, read and written on writer threads, a slow disk never stalls the loop
+        part, headers = await self.writer.arun(self._resume_part, p)
+        start, written = time.perf_counter(), 0.0
+        try:
+            async with self.asset_governor.slot() as slot, self.session.stream('GET', src, headers=headers) as r:
+                slot.observe(r.status_code)
+                h, f = await self.writer.arun(self._open_part, r, part)
+                if f is not None:
+                    logger.info('Writing image to %s', p)
+                    buf = bytearray()
+                    try:
+                        async for chunk in r.aiter_bytes(self.chunk_size):
+                            h.update(chunk)
+                            buf += chunk
+                            if len(buf) >= self.write_size:
+                                written += await self.writer.arun(self.writer.append, f, bytes(buf))
+                                buf.clear()
+                            if self.bandwidth is not None:
+                                await self.bandwidth.consume(len(chunk))
+                    finally:
+                        # what arrived is kept for a resume even when the stream broke
+                        if buf:
+                            written += await self.writer.arun(self.writer.append, f, bytes(buf))
+                        await self.writer.arun(f.close)
+        except Exception as e:
+            self._on_error(e, src, ori_url)
+            return False
+        self._succeed(src)
+        self._streamed(r, start, written)
+        # waiting for the writer lets other pages showing the image link it instead of fetching it again
+        await asyncio.wrap_future(await self.writer.asubmit(self._finish, src, part, p, h.hexdigest(), written))
+        return True
 
 
 class TextCrawlerAsync(CrawlerAsync, TextCrawler):
 
     async def post_process(self, url, paras, store_path, attr, **kwargs):
 
-        path, contents = self._pre_prepare(paras, store_path)
-        if contents:
-            task = asyncio.create_task(asyncio.to_thread(self._write, path, contents))
-            await task
+        path, contents = self._pre_prepare(paras, store_path, refresh=self._refreshes(url))
+        if path:
+            await self._asubmit(url, self._write, path, contents)
 
 
 def main(Krawler, url, root, containers, redundant=None, **kwargs):
@@ -400,7 +1263,11 @@ def main(Krawler, url, root, containers, redundant=None, **kwargs):
             crawler.crawl(containers, redundant)
     finally:
         crawler.store()
-        logger.info('Remaining %d  finished %d', len(crawler.urls), len(crawler.explored))
+        crawler.writer.close()
+        crawler.metrics.close()
+        logger.info('Remaining %d  finished %d  frontier memory %.1f bytes per url  connection reuse %.1f%%',
+                    len(crawler.scheduler), crawler.frontier.explored_count, crawler.frontier.bytes_per_url(),
+                    crawler.session.reuse_rate() * 100)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,346 @@
+import hashlib
+import math
+import sys
+import tempfile
+from array import array
+from collections import deque
+from itertools import chain
+
+
+def fingerprint(url):
+    """64 bit fingerprint of a url, never 0 which marks an empty slot."""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), 'little') or 1
+
+
+def _unpack(item):
+    depth, url = item.split('\t', 1)
+    return url, int(depth)
+
+
+class BloomFilter:
+    """bit array pre-check in front of a fingerprint set, answers 'definitely absent' or 'maybe present'."""
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.m = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, fp):
+        h1, h2 = fp & 0xffffffff, (fp >> 32) | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, fp):
+        for p in self._positions(fp):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, fp):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(fp))
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+
+class FingerprintSet:
+    """open addressing hash set of 64 bit fingerprints stored in an array('Q'), 8 bytes per slot."""
+
+    def __init__(self, capacity=1 << 10, bloom=None):
+        self.table = array('Q', bytes(8 * capacity))
+        self.mask = capacity - 1
+        self.size = 0
+        self.bloom = bloom
+
+    def _find(self, fp):
+        table, mask = self.table, self.mask
+        i = fp & mask
+        while True:
+            v = table[i]
+            if v == fp or v == 0:
+                return i, v
+            i = (i + 1) & mask
+
+    def add(self, fp):
+        i, v = self._find(fp)
+        if v:
+            return
+        self.table[i] = fp
+        self.size += 1
+        if self.bloom is not None:
+            self.bloom.add(fp)
+        if self.size * 2 > len(self.table):
+            self._grow()
+
+    def discard(self, fp):
+        i, v = self._find(fp)
+        if not v:
+            return
+        # backward shift deletion keeps probe chains intact without tombstones
+        table, mask = self.table, self.mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            v = table[j]
+            if v == 0:
+                break
+            k = v & mask
+            if (i < j and (k <= i or k > j)) or (i > j and k <= i and k > j):
+                table[i] = v
+                i = j
+        table[i] = 0
+        self.size -= 1
+
+    def __contains__(self, fp):
+        if self.bloom is not None and fp not in self.bloom:
+            return False
+        return self._find(fp)[1] != 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (v for v in self.table if v)
+
+    def _grow(self):
+        old = self.table
+        self.table = array('Q', bytes(16 * len(old)))
+        self.mask = len(self.table) - 1
+        self.size = 0
+        for v in old:
+            if v:
+                i, _ = self._find(v)
+                self.table[i] = v
+                self.size += 1
+
+    @property
+    def nbytes(self):
+        return self.table.itemsize * len(self.table) + (self.bloom.nbytes if self.bloom is not None else 0)
+
+
+class SpillQueue:
+    """fifo queue of strings keeping at most about 2 * *buffer* items in memory, the rest spill to a temp file."""
+
+    def __init__(self, buffer=10_000, dir=None):
+        self.buffer = buffer
+        self.dir = dir
+        self.head = deque()
+        self.tail = []
+        self.spilled = 0
+        self._file = None
+        self._read = 0
+
+    def push(self, item):
+        if not self.spilled and not self.tail and len(self.head) < self.buffer:
+            self.head.append(item)
+            return
+        self.tail.append(item)
+        if len(self.tail) >= self.buffer:
+            self._spill()
+
+    def pop(self):
+        if not self.head:
+            if self.spilled:
+                self._refill()
+            else:
+                self.head.extend(self.tail)
+                self.tail.clear()
+        return self.head.popleft()
+
+    def __len__(self):
+        return len(self.head) + self.spilled + len(self.tail)
+
+    def __iter__(self):
+        yield from list(self.head)
+        if self.spilled:
+            self._file.seek(self._read)
+            for _ in range(self.spilled):
+                yield self._file.readline().decode().rstrip('\n')
+        yield from list(self.tail)
+
+    def _spill(self):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.dir)
+        self._file.seek(0, 2)
+        self._file.write(''.join(f'{item}\n' for item in self.tail).encode())
+        self.spilled += len(self.tail)
+        self.tail.clear()
+
+    def _refill(self):
+        f = self._file
+        f.seek(self._read)
+        n = min(self.buffer, self.spilled)
+        self.head.extend(f.readline().decode().rstrip('\n') for _ in range(n))
+        self.spilled -= n
+        self._read = f.tell()
+        if not self.spilled:
+            f.seek(0)
+            f.truncate()
+            self._read = 0
+
+    def copy(self):
+        """independent snapshot of the current items, spilled items are copied file to file."""
+        q = SpillQueue(self.buffer, self.dir)
+        q.head = deque(self.head)
+        q.tail = list(self.tail)
+        if self.spilled:
+            q._file = tempfile.TemporaryFile(dir=self.dir)
+            self._file.seek(self._read)
+            while chunk := self._file.read(1 << 20):
+                q._file.write(chunk)
+            q.spilled = self.spilled
+        return q
+
+    @property
+    def nbytes(self):
+        return (sys.getsizeof(self.head) + sys.getsizeof(self.tail)
+                + sum(sys.getsizeof(item) for item in self.head) + sum(sys.getsizeof(item) for item in self.tail))
+
+
+class Frontier:
+    """
+    pending and explored urls of one crawl, pending urls are handed out first in first out with their depth.
+    *add* queues a url unless it is pending or explored already, *pop* hands out a pending url which stays
+    pending until *explore* marks it explored, *restore* moves an explored url back to the queue.
+    *snapshot* returns records ('a', url, depth) for queued and ('e', url) or ('x', fingerprint) for explored urls,
+    they are safe to consume outside the caller's lock.
+    """
+
+    def add(self, url, depth=0):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def explore(self, url):
+        raise NotImplementedError
+
+    def explore_fingerprint(self, fp):
+        raise ValueError(f'{type(self).__name__} cannot restore explored urls from fingerprints')
+
+    def restore(self, url, depth=0):
+        raise NotImplementedError
+
+    def __contains__(self, url):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    @property
+    def explored_count(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        raise NotImplementedError
+
+    def bytes_per_url(self):
+        n = len(self) + self.explored_count
+        return self.nbytes / n if n else 0.0
+
+
+class MemoryFrontier(Frontier):
+    """full url strings in python containers, fast but memory grows with every url."""
+
+    def __init__(self):
+        self.urls = {}
+        self.queue = deque()
+        self.explored = set()
+
+    def add(self, url, depth=0):
+        if url in self.explored or url in self.urls:
+            return False
+        self.urls[url] = depth
+        self.queue.append(url)
+        return True
+
+    def pop(self):
+        # urls explored since they were queued come out too, callers skip explored urls like with DiskFrontier
+        url = self.queue.popleft()
+        return url, self.urls.get(url, 0)
+
+    def explore(self, url):
+        self.urls.pop(url, None)
+        self.explored.add(url)
+
+    def restore(self, url, depth=0):
+        self.explored.discard(url)
+        self.add(url, depth)
+
+    def __contains__(self, url):
+        return url in self.explored
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def explored_count(self):
+        return len(self.explored)
+
+    def snapshot(self):
+        urls, explored = list(self.urls.items()), list(self.explored)
+        return chain((('a', url, depth) for url, depth in urls), (('e', url) for url in explored))
+
+    @property
+    def nbytes(self):
+        return (sys.getsizeof(self.urls) + sys.getsizeof(self.queue) + sys.getsizeof(self.explored)
+                + sum(sys.getsizeof(url) for url in self.urls) + sum(sys.getsizeof(url) for url in self.explored))
+
+
+class DiskFrontier(Frontier):
+    """
+    pending urls in a SpillQueue, pending and explored urls as fingerprints in FingerprintSets.
+    :param buffer: pending urls kept in memory before spilling to disk.
+    :param bloom: expected number of explored urls to size a BloomFilter pre-check, None for no filter.
+    :param dir: directory for the spill file, default is the system temp directory.
+    """
+
+    def __init__(self, buffer=10_000, bloom=None, dir=None):
+        self.queue = SpillQueue(buffer, dir)
+        self.pending = FingerprintSet()
+        self.explored = FingerprintSet(bloom=BloomFilter(bloom) if bloom else None)
+
+    def add(self, url, depth=0):
+        fp = fingerprint(url)
+        if fp in self.explored or fp in self.pending:
+            return False
+        self.pending.add(fp)
+        self.queue.push(f'{depth}\t{url}')
+        return True
+
+    def pop(self):
+        if not self.queue:
+            raise KeyError('pop from an empty frontier')
+        return _unpack(self.queue.pop())
+
+    def explore(self, url):
+        fp = fingerprint(url)
+        self.pending.discard(fp)
+        self.explored.add(fp)
+
+    def explore_fingerprint(self, fp):
+        self.explored.add(fp)
+
+    def restore(self, url, depth=0):
+        self.explored.discard(fingerprint(url))
+        self.add(url, depth)
+
+    def __contains__(self, url):
+        return fingerprint(url) in self.explored
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def explored_count(self):
+        return len(self.explored)
+
+    def snapshot(self):
+        queue, explored = self.queue.copy(), array('Q', self.explored.table)
+        return chain((('a', *_unpack(item)) for item in queue), (('x', fp) for fp in explored if fp))
+
+    @property
+    def nbytes(self):
+        return self.queue.nbytes + self.pending.nbytes + self.explored.nbytes
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+
+class _Slot:
+
+    __slots__ = ('start', 'latency', 'overloaded')
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.latency = None
+        self.overloaded = False
+
+    def observe(self, status_code):
+        """call once response headers arrived."""
+        self.latency = time.monotonic() - self.start
+        self.overloaded = status_code == 429 or status_code >= 500
+
+
+class Governor:
+    """
+    AIMD limit on requests in flight, shared by every fetch of a crawler.
+    each healthy response grows the limit by 1 / limit, so about 1 per round trip of the whole window,
+    a timeout, connection error, 429 or 5xx halves it, at most once per *cooldown* seconds.
+    :param initial: limit to start with.
+    :param minimum: limit never goes below.
+    :param maximum: limit never goes above.
+    :param latency: seconds to response headers, slower responses keep the limit where it is.
+    :param backoff: factor the limit is multiplied with on overload.
+    :param cooldown: seconds between two cuts, a burst of failures from one congestion cuts once.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=100, latency=2.0, backoff=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency = latency
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._limit = float(min(max(initial, minimum), maximum))
+        self.inflight = 0
+        self._cut = 0.0
+        self._cond = asyncio.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < self.limit)
+            self.inflight += 1
+        slot = _Slot()
+        try:
+            yield slot
+        except Exception:
+            # timeouts and connection errors, errors after the headers are judged by the status code
+            if slot.latency is None:
+                slot.overloaded = True
+            raise
+        finally:
+            async with self._cond:
+                self.inflight -= 1
+                self._update(slot)
+                # wake only as many as may start, thousands of queued downloads would all wake for one slot
+                self._cond.notify(max(0, self.limit - self.inflight))
+
+    def _update(self, slot):
+        if slot.overloaded:
+            now = time.monotonic()
+            if now - self._cut >= self.cooldown:
+                self._cut = now
+                self._limit = max(self.minimum, self._limit * self.backoff)
+        elif slot.latency is not None and slot.latency <= self.latency:
+            self._limit = min(self.maximum, self._limit + 1 / self._limit)
+
+
+class Bandwidth:
+    """
+    token bucket capping the bytes per second of every stream sharing it.
+    a chunk is let through at once and its stream then sleeps off the debt, so the cap holds on average.
+    :param rate: bytes per second.
+    :param burst: bytes let through without waiting after an idle spell, default one second worth.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+
+    async def consume(self, n):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate) - n
+        self._stamp = now
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class FairShare:
+    """
+    slots of one Governor handed out to several sites in turn. while the governor is full, waiting fetches
+    are queued per site and every freed slot goes to the next site in line, so a site with thousands of
+    queued fetches gets no more of the budget than one with a few.
+    :param governor: the Governor whose limit is shared.
+    """
+
+    def __init__(self, governor):
+        self.governor = governor
+        self.queues = {}     # site -> futures of its waiting fetches
+        self.turns = deque()  # sites with waiting fetches, next in line first
+        self.granted = 0
+        self.inflight = Counter()
+
+    def view(self, key):
+        """the share of site *key*, used by its crawler like a Governor of its own."""
+        return _Share(self, key)
+
+    async def acquire(self, key):
+        if not self.turns and self.granted < self.governor.limit:
+            self._grant(key)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.turns.append(key)
+        queue.append(waiter)
+        self._dispatch()  # sites in line may only hold cancelled fetches
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(key)  # granted as it was cancelled, pass the slot on
+            raise
+
+    def release(self, key):
+        self.granted -= 1
+        self.inflight[key] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.turns and self.granted < self.governor.limit:
+            key = self.turns.popleft()
+            queue = self.queues[key]
+            waiter = queue.popleft()
+            if queue:
+                self.turns.append(key)
+            else:
+                del self.queues[key]
+            if not waiter.done():
+                self._grant(key)
+                waiter.set_result(None)
+
+    def _grant(self, key):
+        self.granted += 1
+        self.inflight[key] += 1
+
+
+class _Share:
+
+    def __init__(self, fair, key):
+        self.fair = fair
+        self.key = key
+
+    @property
+    def inflight(self):
+        return self.fair.inflight[self.key]
+
+    @property
+    def limit(self):
+        return self.fair.governor.limit
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.fair.acquire(self.key)
+        try:
+            async with self.fair.governor.slot() as slot:
+                yield slot
+        finally:
+            self.fair.release(self.key)
@@ -0,0 +1,229 @@
+import heapq
+import json
+import os
+import threading
+import time
+from itertools import count
+from pathlib import Path
+
+
+class _Syncer:
+    """one daemon thread fsyncing every journal some *fsync_interval* after its first unsynced append."""
+
+    def __init__(self):
+        self.due = []  # (time, seq, journal)
+        self.cond = threading.Condition()
+        self.thread = None
+        self._seq = count()
+
+    def schedule(self, journal, at):
+        with self.cond:
+            heapq.heappush(self.due, (at, next(self._seq), journal))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='journal-sync', daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.due or self.due[0][0] > time.monotonic():
+                    self.cond.wait(self.due[0][0] - time.monotonic() if self.due else None)
+                _, _, journal = heapq.heappop(self.due)
+            journal._background_sync()
+
+
+_syncer = _Syncer()
+
+
+class Journal:
+    """
+    append-only record log, one json array per line.
+    records reach the OS as soon as they are appended, so a killed process loses nothing,
+    fsync runs on a background thread *fsync_interval* seconds after an append, and on flush.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = Path(path)
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self.lock = threading.Lock()
+        self._f = None
+        self._pending = False  # a background fsync is scheduled
+
+    def replay(self):
+        """yield records in order, drop a torn tail line left by a hard kill."""
+        good = 0
+        try:
+            with self.path.open('rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    self.count += 1
+                    yield record
+                torn = f.seek(0, os.SEEK_END) != good
+        except FileNotFoundError:
+            return
+        if torn:
+            os.truncate(self.path, good)
+
+    def append(self, *record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self._f is None:
+                self._f = self.path.open('a', encoding='utf-8', buffering=1)
+            self._f.write(line)
+            self.count += 1
+            if not self._pending:
+                self._pending = True
+                _syncer.schedule(self, time.monotonic() + self.fsync_interval)
+
+    def flush(self):
+        with self.lock:
+            if self._f is not None:
+                self._sync()
+
+    def rotate(self):
+        """move current records aside to *path*.1 and start an empty journal, return the old path."""
+        old = self.path.with_name(self.path.name + '.1')
+        with self.lock:
+            self._close()
+            if self.path.exists():
+                if old.exists():
+                    # previous compaction never finished, keep its records in front of ours
+                    with old.open('ab') as dst, self.path.open('rb') as src:
+                        dst.write(src.read())
+                    self.path.unlink()
+                else:
+                    self.path.rename(old)
+            self.count = 0
+        return old
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _background_sync(self):
+        # appends go on while the disk syncs, a duplicate descriptor outlives a rotate or close meanwhile
+        with self.lock:
+            self._pending = False
+            if self._f is None:
+                return
+            self._f.flush()
+            fd = os.dup(self._f.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _close(self):
+        if self._f is not None:
+            self._sync()
+            self._f.close()
+            self._f = None
+
+
+def write_atomic(path, write, mode='w', **kwargs):
+    """write to a sibling temp file via *write(f)* then rename it over *path*."""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open(mode, **kwargs) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_records(path, records):
+    """atomically replace *path* with a journal holding *records*."""
+    write_atomic(path, lambda f: f.writelines(json.dumps(r, ensure_ascii=False) + '\n' for r in records),
+                 encoding='utf-8')
+
+
+class JournalDict:
+    """
+    dict persisted as a snapshot at *path* plus a journal of changes at *path*.journal,
+    compacted into the snapshot every *compact_every* changes.
+    """
+
+    def __init__(self, path, compact_every=100_000):
+        self.path = Path(path)
+        self.journal = Journal(self.path.with_name(self.path.name + '.journal'))
+        self.compact_every = compact_every
+        self.data = {}
+        self.lock = threading.Lock()
+        self._compacting = threading.Lock()
+        old = Journal(self.journal.path.with_name(self.journal.path.name + '.1'))
+        for journal in (Journal(self.path), old, self.journal):
+            for op, key, *value in journal.replay():
+                if op == 's':
+                    self.data[key] = value[0]
+                else:
+                    self.data.pop(key, None)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.journal.append('s', key, value)
+        self._maybe_compact()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.journal.append('d', key)
+            value = self.data.pop(key)
+        self._maybe_compact()
+        return value
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(list(self.data))
+
+    def items(self):
+        return list(self.data.items())
+
+    def reset(self, data):
+        """replace every entry with the ones of mapping *data*, straight into a fresh snapshot."""
+        with self.lock:
+            self.data = dict(data)
+        self.compact()
+
+    def _maybe_compact(self):
+        if self.journal.count >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        if not self._compacting.acquire(blocking=False):
+            return
+        try:
+            with self.lock:
+                items = list(self.data.items())
+                old = self.journal.rotate()
+            write_records(self.path, (('s', k, v) for k, v in items))
+            old.unlink(missing_ok=True)
+        finally:
+            self._compacting.release()
+
+    def flush(self):
+        self.journal.flush()
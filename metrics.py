@@ -0,0 +1,141 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from journal import write_atomic
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = [*labels, *extra.items()]
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+class Metrics:
+    """
+    counters, gauges and histograms of a crawl, rendered in the Prometheus text format.
+    :param path: file the metrics are written to every *interval* seconds and on store, None for no file.
+    :param port: serve the metrics at http://127.0.0.1:*port*/metrics, None for no endpoint.
+    :param interval: seconds between two writes of *path*.
+    :param buckets: upper bounds of the histogram buckets.
+    """
+
+    def __init__(self, path=None, port=None, interval=5.0, buckets=BUCKETS):
+        self.path = path
+        self.interval = interval
+        self.buckets = buckets
+        self.counters = {}    # (name, labels) -> value
+        self.gauges = {}      # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count over all, sum]
+        self.lock = threading.Lock()
+        self._writing = threading.Lock()
+        self._written = time.monotonic()
+        self.server = None
+        if port is not None:
+            self.serve(port)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += 1
+            h[-1] += value
+
+    def value(self, name, **labels):
+        """sum of a counter, or count of a histogram, over every label set matching *labels*."""
+        wanted = set(labels.items())
+        with self.lock:
+            total = sum(v for (n, ls), v in self.counters.items() if n == name and wanted <= set(ls))
+            return total + sum(h[-2] for (n, ls), h in self.histograms.items() if n == name and wanted <= set(ls))
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters, gauges = sorted(self.counters.items()), sorted(self.gauges.items())
+            histograms = sorted((key, list(h)) for key, h in self.histograms.items())
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            typed = set()
+            for (name, labels), value in values:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name}{_labels(labels)} {value}')
+        typed = set()
+        for (name, labels), h in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, n in zip(self.buckets, h):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {h[-2]}')
+            lines.append(f'{name}_sum{_labels(labels)} {h[-1]}')
+            lines.append(f'{name}_count{_labels(labels)} {h[-2]}')
+        return '\n'.join(lines) + '\n'
+
+    def maybe_write(self):
+        if self.path is not None and time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def write(self):
+        if self.path is None:
+            return
+        with self._writing:
+            self._written = time.monotonic()
+            write_atomic(self.path, lambda f: f.write(self.render()), encoding='utf-8')
+
+    def serve(self, port):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -5,6 +5,8 @@ from bs4 import BeautifulSoup as Soup
 from pathlib import Path
 import random
 
+from archive import TextArchive
+
 
 def walk(path):
     for root, dirs, files in os.walk(path):
@@ -111,15 +113,25 @@ class Image2SlideReader(Reader):
 class TextReader(Reader):
 
     def read(self, file, replacement_pairs=None):
-        contents = ''
         with open(file, 'r', encoding='utf-8') as f:
-            for i, line in enumerate(f.readlines()):
-                if i == 0:
-                    contents += f'# {line.strip()}\n\n'
-                else:
-                    contents += f'{line.strip()}\n\n'
+            return self.format(f.readlines())
+
+    def format(self, lines):
+        contents = ''
+        for i, line in enumerate(lines):
+            if i == 0:
+                contents += f'# {line.strip()}\n\n'
+            else:
+                contents += f'{line.strip()}\n\n'
         return contents
 
+    def merge(self, src, cat: [str | tuple], replacement_pairs: [list, tuple]) -> str:
+        # src may be an archive of TextCrawler(archive=True), its pages are read in place
+        if not TextArchive.is_archive(src):
+            return super().merge(src, cat, replacement_pairs)
+        return ''.join(self.format(record['text'].splitlines())
+                       for key, record in TextArchive(src).items() if key.endswith(cat))
+
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,100 @@
+import asyncio
+import inspect
+
+import httpx
+
+from coloredlogger import coloredlogger
+from governor import FairShare, Governor
+from metrics import Metrics
+from storage import Writer
+from transport import Transport
+
+logger = coloredlogger(__name__)
+
+# parameters of the transport and its httpx clients, the rest of the keyword arguments are the crawlers'
+_TRANSPORT = ({*inspect.signature(Transport).parameters, *inspect.signature(httpx.AsyncClient).parameters}
+              - {'asynchronous', 'limits', 'timeout', 'kwargs'})
+
+
+class SiteMixin:
+    """
+    turns an async crawler into one site of a multi-site crawl. the site fetches through the transport
+    of the run and takes its turn at the budgets of the run instead of having a pool and budget of its own.
+    """
+
+    def __init__(self, url, root, *, site, **kwargs):
+        self.transport, pages, assets = site
+        super().__init__(url, root, **kwargs)
+        self.governor = pages.view(self.domain)
+        if hasattr(self, 'asset_governor'):
+            self.asset_governor = assets.view(self.domain)
+
+    def _client(self, limits, timeout, **kwargs):
+        # the transport parameters went to the shared transport, what is left is meant for other crawler classes
+        return self.transport
+
+    def _worker_type(self):
+        # parse workers only need the crawler the site was made of
+        return type(self).__bases__[1]
+
+    async def aclose(self):
+        # the loop runs the other sites too, their tasks are not this site's to wait for
+        pass
+
+
+async def _crawl_site(crawler, containers, redundant):
+    try:
+        await crawler.crawl(containers, redundant)
+    except Exception as e:
+        logger.error('Crawling %s failed, %s: %s', crawler.domain, type(e).__name__, e)
+    finally:
+        # store waits for the writer, which the other sites keep busy
+        await asyncio.to_thread(crawler.store)
+        logger.info('Site %s finished %d', crawler.domain, crawler.frontier.explored_count)
+
+
+async def _crawl_sites(jobs, root, max_workers, asset_workers, limits, timeout, metrics, writer, kwargs):
+    client = {k: kwargs.pop(k) for k in list(kwargs) if k in _TRANSPORT}
+    # a host may take the whole budget while the other sites are done
+    transport = Transport(asynchronous=True, limits=max(limits, max_workers + asset_workers), timeout=timeout,
+                          **client)
+    pages = FairShare(Governor(initial=max(1, max_workers // 4), maximum=max_workers))
+    assets = FairShare(Governor(initial=max(1, asset_workers // 4), maximum=asset_workers))
+    crawlers = []
+    try:
+        for url, containers, redundant, Krawler in jobs:
+            cls = type(f'Site{Krawler.__name__}', (SiteMixin, Krawler), {})
+            crawler = cls(url, root, site=(transport, pages, assets), max_workers=max_workers, metrics=metrics,
+                          writer=writer, **kwargs)
+            if any(crawler.data == other.data for other, _, _ in crawlers):
+                raise ValueError(f'{crawler.domain} is crawled twice, its state files would be shared')
+            crawlers.append((crawler, containers, redundant))
+        await asyncio.gather(*(_crawl_site(*job) for job in crawlers))
+    finally:
+        await transport.aclose()
+    logger.info('%d sites finished %d, connection reuse %.1f%%', len(crawlers),
+                sum(crawler.frontier.explored_count for crawler, _, _ in crawlers), transport.reuse_rate() * 100)
+
+
+def crawl_sites(jobs, root, max_workers=100, asset_workers=None, limits=100, timeout=5, metrics=None, **kwargs):
+    """
+    crawl several sites in one event loop. every job is (url, containers, redundant, Krawler), Krawler an
+    async crawler class, each site keeps its own state files and output directory under *root*.
+    all sites fetch through one transport and share one budget of *max_workers* pages and *asset_workers*
+    images in flight, a freed slot goes to the next site waiting for one, so a big site cannot starve the others.
+    :param limits: max connections per host.
+    :param metrics: a Metrics every site reports to, their counters add up.
+    :param kwargs: parameters of Transport and httpx.AsyncClient, such as *follow_redirects* or *http2*, go to the
+        shared transport, other parameters pass to every crawler.
+    """
+    for url, _, _, Krawler in jobs:
+        if not asyncio.iscoroutinefunction(Krawler.crawl):
+            raise ValueError(f'{Krawler.__name__} is no async crawler, cannot crawl {url} in one loop')
+    asset_workers = max_workers if asset_workers is None else asset_workers
+    metrics = Metrics() if metrics is None else metrics
+    writer = Writer(metrics=metrics)
+    try:
+        asyncio.run(_crawl_sites(jobs, root, max_workers, asset_workers, limits, timeout, metrics, writer, kwargs))
+    finally:
+        writer.close()
+        metrics.close()
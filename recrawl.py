@@ -0,0 +1,62 @@
+import heapq
+import math
+import time
+
+from journal import JournalDict
+
+
+class Recrawl:
+    """
+    visit history of every fetched page and the revisit schedule derived from it. a page is due again
+    after the mean time between its changes, estimated from how many of its visits found new content,
+    kept between *min_interval* and *max_interval* seconds. pages never seen changing drift to *max_interval*.
+    :param path: file the history is kept in, a JournalDict.
+    :param min_interval: seconds a page waits at least before it is fetched again.
+    :param max_interval: seconds a page waits at most.
+    :param budget: max pages revisited per run, the most overdue first, None for no limit.
+    """
+
+    def __init__(self, path, min_interval=3600.0, max_interval=30 * 86400.0, budget=None, compact_every=100_000):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        # url -> [first fetch, last fetch, last change, content hash, fetches, changes seen]
+        self.visits = JournalDict(path, compact_every=compact_every)
+
+    def visit(self, url, digest):
+        """record a fetch of *url*, *digest* None if the server answered not modified. return whether it changed."""
+        now = time.time()
+        v = self.visits.get(url)
+        if v is None:
+            self.visits[url] = [now, now, now, digest, 1, 0]
+            return True
+        first, _, change, old, fetches, changes = v
+        changed = digest is not None and digest != old
+        self.visits[url] = [first, now, now if changed else change, digest or old, fetches + 1, changes + changed]
+        return changed
+
+    def interval(self, url):
+        """seconds between two visits of *url*."""
+        first, last, _, _, fetches, changes = self.visits[url]
+        n = fetches - 1
+        if n == 0 or last <= first:
+            # one look tells nothing about the rate, look again soon
+            return self.min_interval
+        # estimator of Cho and Garcia-Molina for n evenly spaced visits of which *changes* found new content,
+        # it accounts for pages changing more than once between two visits, counting changes does not
+        rate = -math.log((n - changes + 0.5) / (n + 0.5)) * n / (last - first)
+        return min(max(1 / rate if rate else self.max_interval, self.min_interval), self.max_interval)
+
+    def due(self):
+        """urls due for a revisit, the most overdue relative to their interval first, at most *budget*."""
+        now = time.time()
+        late = (((now - self.visits[url][1]) / self.interval(url), url) for url in self.visits)
+        due = [(t, url) for t, url in late if t >= 1]
+        due = heapq.nlargest(self.budget, due) if self.budget is not None else sorted(due, reverse=True)
+        return [url for _, url in due]
+
+    def __len__(self):
+        return len(self.visits)
+
+    def flush(self):
+        self.visits.flush()
@@ -0,0 +1,195 @@
+import heapq
+import random
+import time
+from itertools import count
+from urllib.parse import urlparse
+
+
+class _Host:
+
+    __slots__ = ('heap', 'inflight', 'next_time', 'delay', 'failures')
+
+    def __init__(self, delay):
+        self.heap = []
+        self.inflight = 0
+        self.next_time = 0.0
+        self.delay = delay
+        self.failures = 0  # failed requests in a row
+
+
+class Scheduler:
+    """
+    hands out pending urls of a frontier ordered by priority then depth, keeping per host politeness.
+    :param frontier: Frontier to pull pending urls from.
+    :param priority: callable(url, depth) returns a number, smaller goes first, default is depth (breadth first).
+    :param delay: minimum seconds between two requests starting on the same host.
+    :param max_per_host: max requests in flight on the same host, None for no limit.
+    :param window: max urls pulled out of the frontier and held here for ordering.
+    :param attempts: max times a url is fetched before a failure is final.
+    :param backoff: seconds the first retry waits, doubled on every further attempt, with jitter.
+    :param max_backoff: seconds a retry waits at most, unless the server asks for longer with Retry-After.
+    :param breaker: failed requests in a row that pause a host, None never pauses.
+    :param pause: seconds a host is paused once its breaker trips.
+    """
+
+    def __init__(self, frontier, priority=None, delay=0.0, max_per_host=None, window=10_000,
+                 attempts=3, backoff=1.0, max_backoff=300.0, breaker=5, pause=60.0):
+        self.frontier = frontier
+        self.priority = priority or (lambda url, depth: depth)
+        self.delay = delay
+        self.max_per_host = max_per_host
+        self.window = window
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self.pause = pause
+        self.hosts = {}
+        self.ready = []   # (priority, depth, seq, host) of the best url of every host that can start one now
+        self.timers = []  # (time, host) of hosts waiting for their delay
+        self.delayed = []  # (time, url, depth) of failed urls waiting for their retry
+        self.failed = {}  # url -> failed attempts so far
+        self.retrying = set()  # urls in delayed
+        self.inflight = {}  # url -> (host, depth)
+        self.held = 0
+        self._seq = count()
+
+    def _host(self, host):
+        st = self.hosts.get(host)
+        if st is None:
+            st = self.hosts[host] = _Host(self.delay)
+        return st
+
+    def set_delay(self, host, delay):
+        """seconds between two requests starting on *host*, never less than the default delay."""
+        self._host(host).delay = max(self.delay, delay)
+
+    def _available(self, st, now):
+        return st.next_time <= now and (self.max_per_host is None or st.inflight < self.max_per_host)
+
+    def _activate(self, host, now):
+        st = self.hosts[host]
+        if not st.heap:
+            return
+        if self._available(st, now):
+            p, d, seq, _ = st.heap[0]
+            heapq.heappush(self.ready, (p, d, seq, host))
+        elif st.next_time > now:
+            heapq.heappush(self.timers, (st.next_time, host))
+
+    def push(self, url, depth):
+        host = urlparse(url).netloc
+        st = self._host(host)
+        entry = (self.priority(url, depth), depth, next(self._seq), url)
+        heapq.heappush(st.heap, entry)
+        self.held += 1
+        if st.heap[0] is entry:
+            self._activate(host, time.monotonic())
+
+    def _refill(self):
+        while self.held < self.window and len(self.frontier):
+            url, depth = self.frontier.pop()
+            if url not in self.frontier:
+                self.push(url, depth)
+
+    def next(self):
+        """return the next url allowed to start now, None if every pending url has to wait."""
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, url, depth = heapq.heappop(self.delayed)
+            self.retrying.discard(url)
+            self.frontier.restore(url, depth)
+        self._refill()
+        while self.timers and self.timers[0][0] <= now:
+            _, host = heapq.heappop(self.timers)
+            self._activate(host, now)
+        while self.ready:
+            _, _, seq, host = heapq.heappop(self.ready)
+            st = self.hosts[host]
+            if not st.heap or st.heap[0][2] != seq or not self._available(st, now):
+                continue
+            _, depth, _, url = heapq.heappop(st.heap)
+            self.held -= 1
+            if url in self.frontier:
+                self._activate(host, now)
+                continue
+            st.inflight += 1
+            st.next_time = now + st.delay
+            self.inflight[url] = (host, depth)
+            self._activate(host, now)
+            return url
+        return None
+
+    def release(self, url):
+        if url not in self.inflight:
+            return
+        host, _ = self.inflight.pop(url)
+        st = self.hosts[host]
+        st.inflight -= 1
+        self._activate(host, time.monotonic())
+
+    def retry(self, url, retry_after=None):
+        """
+        hold a failed inflight url back and restore it to the frontier once its backoff expires.
+        return seconds to wait, None if the url used up its attempts.
+        """
+        if url in self.retrying:
+            # several requests of one page failed, the page is retried once
+            return 0.0
+        n = self.failed.get(url, 0) + 1
+        if n >= self.attempts:
+            self.failed.pop(url, None)
+            return None
+        self.failed[url] = n
+        delay = min(self.max_backoff, self.backoff * 2 ** (n - 1))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, retry_after)
+        heapq.heappush(self.delayed, (time.monotonic() + delay, url, self.depth(url)))
+        self.retrying.add(url)
+        return delay
+
+    def succeed(self, url):
+        # a url retried for failures, its own or of its images, does not vouch for its host
+        if url in self.failed:
+            return
+        st = self.hosts.get(urlparse(url).netloc)
+        if st is not None:
+            st.failures = 0
+
+    def finish(self, url):
+        """forget the failed attempts of *url* once it is done, a fetch that succeeded is not done yet."""
+        self.failed.pop(url, None)
+
+    def fail(self, url):
+        """count a failed request to the host of *url*, return True if it trips the breaker and pauses the host."""
+        host = urlparse(url).netloc
+        st = self._host(host)
+        st.failures += 1
+        if self.breaker is None or st.failures < self.breaker:
+            return False
+        st.failures = 0
+        now = time.monotonic()
+        st.next_time = max(st.next_time, now + self.pause)
+        self._activate(host, now)
+        return True
+
+    def depth(self, url):
+        return self.inflight[url][1] if url in self.inflight else 0
+
+    def wait_time(self):
+        """seconds until the next host delay or retry expires, None if nothing waits."""
+        due = min(self.timers[0][0] if self.timers else float('inf'),
+                  self.delayed[0][0] if self.delayed else float('inf'))
+        if due == float('inf'):
+            return None
+        return max(0.0, due - time.monotonic())
+
+    def snapshot(self):
+        # urls handed out but not explored yet are still pending, explored ones are ignored on load
+        held = [('a', url, depth) for st in self.hosts.values() for _, depth, _, url in st.heap]
+        delayed = [('r', url, depth) for _, url, depth in self.delayed]
+        return held + delayed + [('a', url, depth) for url, (_, depth) in self.inflight.items()]
+
+    def __len__(self):
+        return self.held + len(self.delayed) + len(self.frontier)
@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from pathlib import Path
+
+from coloredlogger import coloredlogger
+from frontier import FingerprintSet, fingerprint
+
+logger = coloredlogger(__name__)
+
+
+class ShardMixin:
+    """
+    turns an async crawler into one shard of a sharded crawl. the shard owns the urls whose fingerprint
+    modulo the shard count is its index, links owned by another shard are sent to that shard's inbox.
+    """
+
+    poll = 0.05  # seconds between two looks into the inbox while waiting
+
+    def __init__(self, url, root, *, shard, **kwargs):
+        self.index, self.count, self.inboxes, self.sent, self.received, self.idle, self.stop = shard
+        self.forwarded = FingerprintSet()  # urls sent to other shards already
+        super().__init__(url, root, **kwargs)
+        if self._owner(self.start) != self.index:
+            self.sitemaps = False  # the owner of the start url seeds for everyone
+
+    def _owner(self, url):
+        return fingerprint(url) % self.count
+
+    def _state(self):
+        return Path(f'{self.domain}.shard{self.index}of{self.count}.snapshot')
+
+    def _resume(self, url):
+        # only the owner of the start url seeds it
+        super()._resume(url if self._owner(url) == self.index else None)
+
+    def _worker_type(self):
+        # parse workers only need the crawler the shard was made of
+        return type(self).__bases__[1]
+
+    def _add_links(self, links, depth):
+        batches = {}
+        for link in links:
+            fp = fingerprint(link)
+            owner = fp % self.count
+            if owner == self.index:
+                self._add_url(link, depth)
+            elif fp not in self.forwarded:
+                self.forwarded.add(fp)
+                batches.setdefault(owner, []).append(link)
+        self._send('a', batches, depth)
+
+    def _revisit(self, links):
+        batches = {}
+        for link in links:
+            batches.setdefault(self._owner(link), []).append(link)
+        super()._revisit(batches.pop(self.index, []))
+        self._send('r', batches, 0)
+
+    def _send(self, op, batches, depth):
+        for owner, batch in batches.items():
+            # counted before it is queued, so the coordinator never sees it neither sent nor received
+            self.sent[self.index] += 1
+            self.inboxes[owner].put((op, batch, depth))
+
+    def _slow_down(self, delay):
+        # every shard keeps its own distance, together they keep the one robots.txt asks for
+        super()._slow_down(delay * self.count)
+
+    def _receive(self):
+        inbox = self.inboxes[self.index]
+        while not inbox.empty():
+            try:
+                op, batch, depth = inbox.get_nowait()
+            except queue.Empty:
+                break
+            self.idle[self.index] = 0
+            if op == 'a':
+                self._add_links(batch, depth)
+            else:
+                self._revisit(batch)
+            self.received[self.index] += 1
+
+    def _more(self, pending):
+        self._receive()
+        busy = super()._more(pending)
+        self.idle[self.index] = 0 if busy else 1
+        return busy or not self.stop.is_set()
+
+    def _wait(self):
+        # wake up regularly to look into the inbox
+        wait = super()._wait()
+        return self.poll if wait is None else min(wait, self.poll)
+
+
+def _run_shard(Krawler, shard, url, root, containers, redundant, kwargs):
+    cls = type(f'Shard{Krawler.__name__}', (ShardMixin, Krawler), {})
+    crawler = cls(url, root, shard=shard, **kwargs)
+    try:
+        asyncio.run(crawler.crawl(containers, redundant))
+    finally:
+        crawler.store()
+        crawler.writer.close()
+        crawler.metrics.close()
+        logger.info('Shard %d finished %d, connection reuse %.1f%%', shard[0], crawler.frontier.explored_count,
+                    crawler.session.reuse_rate() * 100)
+
+
+def crawl_sharded(Krawler, url, root, containers, redundant=None, shards=None, **kwargs):
+    """
+    crawl one site with *shards* processes each running *Krawler*, an async crawler class, on its part of the urls.
+    the calling process coordinates: it stops the shards once every one is idle and no batch of links is in flight.
+    shards are spawned, guard your script with `if __name__ == '__main__':`.
+    """
+    shards = shards or os.cpu_count()
+    ctx = multiprocessing.get_context('spawn')
+    inboxes = [ctx.Queue() for _ in range(shards)]
+    sent, received = ctx.Array('q', shards, lock=False), ctx.Array('q', shards, lock=False)
+    idle = ctx.Array('b', shards, lock=False)
+    stop = ctx.Event()
+    procs = [ctx.Process(target=_run_shard, args=(Krawler, (i, shards, inboxes, sent, received, idle, stop), url,
+                                                    root, containers, redundant, kwargs))
+             for i in range(shards)]
+    for proc in procs:
+        proc.start()
+    try:
+        last = None
+        while any(proc.is_alive() for proc in procs):
+            time.sleep(0.2)
+            state = (all(idle), sum(sent), sum(received))
+            # two equal looks in a row, all idle and every batch received: nothing can start any more
+            if state == last and state[0] and state[1] == state[2]:
+                stop.set()
+            last = state
+    finally:
+        stop.set()
+        for proc in procs:
+            proc.join()
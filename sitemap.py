@@ -0,0 +1,49 @@
+import zlib
+from urllib.robotparser import RobotFileParser
+from xml.etree.ElementTree import XMLPullParser
+
+
+def parse_sitemap(content, chunk=1 << 16):
+    """
+    yield (kind, loc, lastmod) of every entry of a sitemap or a sitemap index, kind is 'url' or 'sitemap'.
+    gzipped content is inflated on the fly, entries are dropped once read so big sitemaps stay small in memory.
+    """
+    inflate = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16) if content[:2] == b'\x1f\x8b' else None
+    parser = XMLPullParser(events=('end',))
+    loc = lastmod = None
+    for i in range(0, len(content), chunk):
+        data = content[i:i + chunk]
+        parser.feed(inflate.decompress(data) if inflate else data)
+        for _, el in parser.read_events():
+            tag = el.tag.rsplit('}', 1)[-1]
+            if tag == 'loc':
+                loc = (el.text or '').strip()
+            elif tag == 'lastmod':
+                lastmod = (el.text or '').strip() or None
+            elif tag in ('url', 'sitemap'):
+                if loc:
+                    yield tag, loc, lastmod
+                loc = lastmod = None
+                el.clear()
+
+
+def parse_robots(status_code, text):
+    # like RobotFileParser.read: 401 and 403 forbid everything, other errors allow everything
+    robots = RobotFileParser()
+    if status_code in (401, 403):
+        robots.disallow_all = True
+    elif status_code >= 400:
+        robots.allow_all = True
+    else:
+        robots.parse(text.splitlines())
+    robots.modified()
+    return robots
+
+
+def crawl_delay(robots, agent='*'):
+    """seconds between two requests asked for by Crawl-delay or Request-rate, None if neither is given."""
+    delay = robots.crawl_delay(agent)
+    rate = robots.request_rate(agent)
+    if rate:
+        delay = max(float(delay or 0), rate.seconds / rate.requests)
+    return float(delay) if delay else None
@@ -0,0 +1,227 @@
+import asyncio
+import os
+from collections import deque
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from coloredlogger import coloredlogger
+from journal import JournalDict
+from metrics import Metrics
+
+logger = coloredlogger(__name__)
+
+
+class Writer:
+    """
+    write-behind stage between fetch workers and the disk. writes run on a thread pool of their own,
+    at most *backlog* of them are queued or running, a fetch worker handing in one more waits for a free slot.
+    file work a coroutine awaits runs on a second pool, never queued behind the writes and their fsyncs.
+    :param workers: writer threads, and threads of the second pool.
+    :param backlog: max writes queued or running, None for no limit.
+    :param fsync_every: written files fsynced together, their directories once per batch, None never fsyncs.
+    :param fsync_interval: max seconds a written file waits for its fsync.
+    :param metrics: a Metrics the disk bytes, fsync seconds, queue depth and backpressure waits go to.
+    """
+
+    def __init__(self, workers=4, backlog=1000, fsync_every=64, fsync_interval=1.0, metrics=None):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='writer')
+        self.io = ThreadPoolExecutor(workers, thread_name_prefix='writer-io')
+        self.slots = None if backlog is None else threading.BoundedSemaphore(backlog)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.metrics = Metrics() if metrics is None else metrics
+        self.dirs = set()      # directories created already
+        self.unsynced = []     # files written since the last fsync
+        self.synced = time.monotonic()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.waiters = deque()  # (loop, future) of coroutines waiting for a slot
+
+    def submit(self, fn, *args):
+        """run fn(*args) on a writer thread, blocks while the backlog is full."""
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            start = time.perf_counter()
+            self.slots.acquire()
+            self.metrics.inc('crawler_write_wait_seconds_total', time.perf_counter() - start)
+        return self._submit(fn, args)
+
+    async def asubmit(self, fn, *args):
+        """like submit, the coroutine waits for a free slot instead of the thread."""
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            while True:
+                waiter = loop.create_future()
+                with self.lock:
+                    self.waiters.append((loop, waiter))
+                # a slot freed before the waiter was queued woke nobody
+                if self.slots.acquire(blocking=False):
+                    waiter.cancel()
+                    break
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    if not waiter.cancelled():
+                        self._wake_one()  # woken and cancelled at once, the wakeup goes to the next one
+                    raise
+                if self.slots.acquire(blocking=False):
+                    break
+            self.metrics.inc('crawler_write_wait_seconds_total', time.perf_counter() - start)
+        return self._submit(fn, args)
+
+    def _wake_one(self):
+        with self.lock:
+            if not self.waiters:
+                return
+            loop, waiter = self.waiters.popleft()
+        loop.call_soon_threadsafe(self._wake, waiter)
+
+    def _wake(self, waiter):
+        # a waiter cancelled or served already passes the slot on
+        if waiter.done():
+            self._wake_one()
+        else:
+            waiter.set_result(None)
+
+    async def arun(self, fn, *args):
+        """run fn(*args) on the second pool and return its result, for file work a coroutine waits for anyway."""
+        return await asyncio.wrap_future(self.io.submit(fn, *args))
+
+    def _submit(self, fn, args):
+        with self.lock:
+            self.pending += 1
+        self.metrics.set('crawler_write_queue', self.pending)
+        return self.pool.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error('Write failed, %s: %s', type(e).__name__, e)
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+                self._wake_one()
+            with self.lock:
+                self.pending -= 1
+                if not self.pending:
+                    self.idle.notify_all()
+            self.metrics.set('crawler_write_queue', self.pending)
+            self._sync()
+
+    def mkdir(self, path):
+        # every file of a page goes to the same few directories, only the first one creates them
+        if path not in self.dirs:
+            os.makedirs(path, exist_ok=True)
+            self.dirs.add(path)
+
+    def write(self, path, data):
+        """write bytes *data* to *path* on the calling thread, creating its directory."""
+        self.mkdir(path.parent)
+        with open(path, 'wb') as f:
+            self.append(f, data)
+        self.track(path)
+
+    def append(self, f, data):
+        """write *data* to open file *f*, return the seconds it took."""
+        start = time.perf_counter()
+        f.write(data)
+        self.metrics.inc('crawler_disk_bytes_total', len(data))
+        return time.perf_counter() - start
+
+    def track(self, path):
+        """fsync *path* and its directory with the next batch."""
+        if self.fsync_every is not None:
+            with self.lock:
+                self.unsynced.append(path)
+
+    def _sync(self, force=False):
+        with self.lock:
+            if not self.unsynced:
+                return
+            if not (force or len(self.unsynced) >= self.fsync_every
+                    or time.monotonic() - self.synced >= self.fsync_interval):
+                return
+            batch, self.unsynced = self.unsynced, []
+            self.synced = time.monotonic()
+        start = time.perf_counter()
+        for path in {*batch, *{p.parent for p in batch}}:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # directories cannot be fsynced on some systems
+            finally:
+                os.close(fd)
+        self.metrics.observe('crawler_fsync_seconds', time.perf_counter() - start)
+
+    def flush(self):
+        """wait for every write handed in so far and fsync what is left."""
+        with self.lock:
+            self.idle.wait_for(lambda: not self.pending)
+        self._sync(force=True)
+
+    def close(self):
+        self.flush()
+        self.pool.shutdown()
+        self.io.shutdown()
+
+
+class Manifest:
+    """
+    relative paths of the files stored under *root*, so checking whether an output exists needs no stat.
+    persisted at *path* like a JournalDict, built with one scandir walk of *root* when there is none yet
+    or on *rebuild*, and kept current as files are written.
+    """
+
+    skip = ('.part', '.part.validator', '.tmp')  # unfinished files are no outputs
+
+    def __init__(self, path, root, rebuild=False, compact_every=100_000):
+        self.root = Path(root)
+        fresh = not Path(path).exists() and not Path(f'{path}.journal').exists()
+        self.files = JournalDict(path, compact_every=compact_every)
+        if fresh or rebuild:
+            self.rebuild()
+
+    def rebuild(self):
+        """forget every entry and walk *root* again, for files added or removed behind the crawler's back."""
+        start = time.perf_counter()
+        self.files.reset(dict.fromkeys(self._walk(), 1))
+        logger.info('Manifest of %s built, %d files in %.1f seconds', self.root, len(self.files),
+                    time.perf_counter() - start)
+
+    def _walk(self):
+        top = str(self.root)
+        dirs = [top]
+        while dirs:
+            try:
+                it = os.scandir(dirs.pop())
+            except FileNotFoundError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif not entry.name.endswith(self.skip):
+                        yield Path(entry.path).relative_to(top).as_posix()
+
+    def _key(self, p):
+        return Path(p).relative_to(self.root).as_posix()
+
+    def add(self, p):
+        self.files[self._key(p)] = 1
+
+    def __contains__(self, p):
+        return self._key(p) in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def flush(self):
+        self.files.flush()
@@ -0,0 +1,76 @@
+import gzip
+
+import httpx
+
+from archive import ResponseArchive, TextArchive
+
+URL = 'http://ex.com/a?b=1'
+# a body holding the blank line that ends the http head
+BODY = '<p>héllo</p>\r\n\r\n<p>world</p>'.encode('utf-8')
+
+
+def _response(body=BODY, headers=(), status=200):
+    headers = [(b'Content-Type', b'text/html; charset=utf-8'), *headers]
+    return httpx.Response(status, headers=headers, content=body, request=httpx.Request('GET', URL))
+
+
+def test_response_round_trip(tmp_path):
+    archive = ResponseArchive(tmp_path / 'warc')
+    archive.add(URL, _response(headers=[(b'ETag', b'"x"'), (b'X-Name', 'é'.encode('utf-8'))]))
+    r = archive.get(URL)
+    assert r.status_code == 200
+    assert r.content == BODY
+    assert r.text == BODY.decode('utf-8')
+    assert str(r.url) == URL
+    assert r.headers['ETag'] == '"x"'
+    assert r.headers.raw[2] == (b'X-Name', 'é'.encode('utf-8'))
+    assert r.headers['Content-Length'] == str(len(BODY))
+
+
+def test_decoded_body_is_kept(tmp_path):
+    archive = ResponseArchive(tmp_path / 'warc')
+    archive.add(URL, _response(gzip.compress(BODY), [(b'Content-Encoding', b'gzip')]))
+    r = archive.get(URL)
+    assert r.content == BODY
+    assert 'Content-Encoding' not in r.headers
+    assert r.headers['Content-Length'] == str(len(BODY))
+
+
+def test_record_is_warc(tmp_path):
+    archive = ResponseArchive(tmp_path / 'warc')
+    archive.add(URL, _response())
+    (_, record), = archive._members()
+    head, _, block = record.partition(b'\r\n\r\n')
+    lines = head.decode().split('\r\n')
+    assert lines[0] == 'WARC/1.1'
+    assert 'WARC-Type: response' in lines and f'WARC-Target-URI: {URL}' in lines
+    length = int(next(line for line in lines if line.startswith('Content-Length: ')).split(': ')[1])
+    assert block[length:] == b'\r\n\r\n'
+    assert ResponseArchive.parse(record).content == BODY
+
+
+def test_reopened_archive_reads_every_record(tmp_path):
+    archive = ResponseArchive(tmp_path / 'warc', segment_size=1)
+    urls = [f'http://ex.com/{i}' for i in range(5)]
+    for i, url in enumerate(urls):
+        archive.add(url, _response(b'%d' % i, status=200 + i))
+    archive.close()
+    archive = ResponseArchive(tmp_path / 'warc')
+    # one record per segment, read back in the order they were added
+    assert len(list(tmp_path.joinpath('warc').glob('responses-*.warc.gz'))) == 5
+    assert [(url, r.status_code, r.content) for url, r in archive.items()] == \
+        [(url, 200 + i, b'%d' % i) for i, url in enumerate(urls)]
+
+def test_torn_segment_tail_is_cut(tmp_path):
+    archive = TextArchive(tmp_path / 'pages')
+    archive.add('a.txt', {'text': 'a'})
+    archive.close()
+    segment = next(tmp_path.joinpath('pages').glob('pages-*.jsonl.gz'))
+    # a record written but never indexed before a kill
+    with segment.open('ab') as f:
+        f.write(gzip.compress(b'{"text": "lost"}\n')[:10])
+    archive = TextArchive(tmp_path / 'pages')
+    archive.add('b.txt', {'text': 'b'})
+    archive.close()
+    assert dict(TextArchive(tmp_path / 'pages').items()) == {'a.txt': {'text': 'a'}, 'b.txt': {'text': 'b'}}
+    assert gzip.decompress(segment.read_bytes()) == b'{"text": "a"}\n{"text": "b"}\n'
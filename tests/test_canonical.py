@@ -0,0 +1,94 @@
+import pytest
+
+from canonical import Canonicalizer, Traps
+
+BASE = 'http://a/b/c/d;p?q'
+
+# RFC 3986 5.4, normal and abnormal examples. canonical urls differ from plain resolution in that the
+# fragment is dropped, an empty path is /, query pairs are re-encoded (a bare key y reads y=) and
+# only http and https urls with a host are kept
+RFC3986 = [
+    ('g:h', None),
+    ('g', 'http://a/b/c/g'),
+    ('./g', 'http://a/b/c/g'),
+    ('g/', 'http://a/b/c/g/'),
+    ('/g', 'http://a/g'),
+    ('//g', 'http://g/'),
+    ('?y', 'http://a/b/c/d;p?y='),
+    ('g?y', 'http://a/b/c/g?y='),
+    ('#s', 'http://a/b/c/d;p?q='),
+    ('g#s', 'http://a/b/c/g'),
+    ('g?y#s', 'http://a/b/c/g?y='),
+    (';x', 'http://a/b/c/;x'),
+    ('g;x', 'http://a/b/c/g;x'),
+    ('g;x?y#s', 'http://a/b/c/g;x?y='),
+    ('', 'http://a/b/c/d;p?q='),
+    ('.', 'http://a/b/c/'),
+    ('./', 'http://a/b/c/'),
+    ('..', 'http://a/b/'),
+    ('../', 'http://a/b/'),
+    ('../g', 'http://a/b/g'),
+    ('../..', 'http://a/'),
+    ('../../', 'http://a/'),
+    ('../../g', 'http://a/g'),
+    ('../../../g', 'http://a/g'),
+    ('../../../../g', 'http://a/g'),
+    ('/./g', 'http://a/g'),
+    ('/../g', 'http://a/g'),
+    ('g.', 'http://a/b/c/g.'),
+    ('.g', 'http://a/b/c/.g'),
+    ('g..', 'http://a/b/c/g..'),
+    ('..g', 'http://a/b/c/..g'),
+    ('./../g', 'http://a/b/g'),
+    ('./g/.', 'http://a/b/c/g/'),
+    ('g/./h', 'http://a/b/c/g/h'),
+    ('g/../h', 'http://a/b/c/h'),
+    ('g;x=1/./y', 'http://a/b/c/g;x=1/y'),
+    ('g;x=1/../y', 'http://a/b/c/y'),
+    # dot segments of the query or fragment are no path
+    ('g?y/./x', 'http://a/b/c/g?y%2F.%2Fx='),
+    ('g#s/./x', 'http://a/b/c/g'),
+    ('g#s/../x', 'http://a/b/c/g'),
+    ('http:g', None),
+]
+
+
+@pytest.mark.parametrize('href, expected', RFC3986)
+def test_rfc3986_examples(href, expected):
+    assert Canonicalizer(allow=None)(BASE, href) == expected
+
+
+@pytest.mark.parametrize('base, href, expected', [
+    ('http://Ex.COM:80/x', '%7Efoo/a%2fb c', 'http://ex.com/~foo/a%2Fb%20c'),
+    ('https://ex.com:443', '', 'https://ex.com/'),
+    ('http://ex.com/a', 'HTTP://EX.com:8080/A#f', 'http://ex.com:8080/A'),
+    ('http://ex.com/a', '  /b  ', 'http://ex.com/b'),
+    ('http://ex.com/a', 'mailto:x@ex.com', None),
+    ('http://ex.com/a', 'javascript:void(0)', None),
+])
+def test_normalisation(base, href, expected):
+    assert Canonicalizer()(base, href) == expected
+
+
+def test_query_parameters():
+    href = '/p?b=2&session=x&a=1'
+    assert Canonicalizer()('http://ex.com/', href) == 'http://ex.com/p'
+    assert Canonicalizer(allow={'a', 'b'})('http://ex.com/', href) == 'http://ex.com/p?a=1&b=2'
+    assert Canonicalizer(allow=None)('http://ex.com/', href) == 'http://ex.com/p?a=1&b=2&session=x'
+
+
+def test_cache_ignores_the_parts_of_the_base_a_link_does_not_depend_on():
+    canonical = Canonicalizer()
+    assert canonical('http://ex.com/a/one?x=1', 'g') == canonical('http://ex.com/a/two', 'g') == 'http://ex.com/a/g'
+    assert canonical('http://ex.com/a/one', '/g') == canonical('http://ex.com/b/two', '/g') == 'http://ex.com/g'
+    assert canonical.cache_info().hits == 2
+
+
+def test_traps():
+    traps = Traps(max_depth=4, max_repeats=2, max_per_pattern=2)
+    assert traps.check('http://ex.com/a/b/c/d/e') == 'path depth'
+    assert traps.check('http://ex.com/a/x/a/a') == 'repeated segment'
+    for day in (1, 2):
+        assert traps.check(f'http://ex.com/cal?d={day}') is None
+        traps.add(f'http://ex.com/cal?d={day}')
+    assert traps.check('http://ex.com/cal?d=3') == 'url pattern'
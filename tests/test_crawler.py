@@ -0,0 +1,153 @@
+import re
+import threading
+
+import httpx
+import pytest
+
+from crawler import TextCrawler
+from metrics import Metrics
+
+URL = 'http://example.com/'
+
+
+@pytest.fixture
+def new(tmp_path, monkeypatch):
+    # state files go to the working directory
+    monkeypatch.chdir(tmp_path)
+    made = []
+
+    def new(url=URL, **kwargs):
+        crawler = TextCrawler(url, tmp_path / 'out', **kwargs)
+        made.append(crawler)
+        return crawler
+
+    yield new
+    for crawler in made:
+        crawler.writer.close()
+        crawler.journal.close()
+
+
+def test_state_named_after_whole_domain(new):
+    assert new().data.name == 'example.com.snapshot'
+
+
+def test_legacy_state_is_resumed(new, tmp_path):
+    (tmp_path / 'example.journal').write_text('["e", "http://example.com/"]\n')
+    crawler = new()
+    assert crawler.data.name == 'example.snapshot'
+    assert URL in crawler.frontier
+
+
+def test_page_in_flight_is_fetched_again(new):
+    crawler = new()
+    url = crawler._next_url()
+    crawler._explore(url)
+    # killed here, the page was never processed
+    resumed = new()
+    assert url not in resumed.frontier
+    assert resumed._next_url() == url
+
+
+def test_page_in_flight_is_not_validated_again(new):
+    crawler = new(cache=True)
+    url = crawler._next_url()
+    crawler._explore(url)
+    assert not crawler._not_modified(url, httpx.Response(200, content=b'page', headers={'ETag': '"1"'}))
+    # killed here, a 304 or the same content must not skip the page
+    resumed = new(cache=True)
+    assert resumed._next_url() == url
+    assert resumed._validators(url) is None
+    resumed._explore(url)
+    assert not resumed._not_modified(url, httpx.Response(200, content=b'page', headers={'ETag': '"2"'}))
+    resumed._release(url)
+    resumed._done(url)
+    assert new(cache=True)._validators(url) == {'If-None-Match': '"2"'}
+
+
+def test_page_explored_once_its_writes_are_done(new):
+    crawler = new()
+    url = crawler._next_url()
+    crawler._explore(url)
+    written = threading.Event()
+    crawler._submit(url, written.wait)
+    crawler._release(url)
+    crawler._done(url)
+    assert url not in new().frontier
+    written.set()
+    crawler.writer.flush()
+    assert url in new().frontier
+
+
+def test_retried_page_stays_pending(new):
+    crawler = new()
+    url = crawler._next_url()
+    crawler._explore(url)
+    crawler._restore_url(url)
+    crawler._release(url)
+    crawler._done(url)
+    assert url not in new().frontier
+
+
+def test_compaction_keeps_unfinished_pages_pending(new):
+    crawler = new()
+    url = crawler._next_url()
+    crawler._explore(url)
+    crawler.compact()
+    assert crawler.data.exists()
+    assert url not in new().frontier
+
+
+def test_compaction_runs_in_background(new):
+    crawler = new(compact_every=5)
+    crawler._add_links([f'{URL}{i}' for i in range(10)], 1)
+    compactor = crawler._compactor
+    assert compactor is not None and compactor is not threading.current_thread()
+    crawler.store()
+    assert not compactor.is_alive()
+    assert len(new().frontier) == 11
+
+
+PAGE = (b'<html><title>Title</title><a href="/next">next</a><div class="side"><p>no</p></div>'
+        b'<section class="post wide"><p>text</p></section></html>')
+
+
+@pytest.mark.parametrize('partial', [False, True])
+@pytest.mark.parametrize('container', [(['div', 'section'], {'class': 'post'}), (re.compile('^sec'), {}),
+                                       ('section', 'post wide'), ('section', {'class': re.compile('wi')})])
+def test_containers_match_like_find_all(new, partial, container):
+    crawler = new(partial=partial)
+    containers = [container, ('p', {})]
+    crawler._strain(containers)
+    page = crawler._parse_html(httpx.Response(200, content=PAGE))
+    ex = crawler._extract(URL, page, containers, None)
+    assert ex.targets == ['text']
+    assert ex.links == [URL + 'next']
+
+
+def test_gauges_of_sites_sharing_metrics_are_apart(new):
+    metrics = Metrics()
+    crawler, other = new(metrics=metrics), new('http://example.org/', metrics=metrics)
+    crawler._add_links([f'{URL}{i}' for i in range(3)], 1)
+    crawler._gauges()
+    other._gauges()
+    assert metrics.gauges[('crawler_queue_depth', (('site', 'example.com'),))] == 4
+    assert metrics.gauges[('crawler_queue_depth', (('site', 'example.org'),))] == 1
+
+
+def test_seed_adds_new_and_revisits_changed_pages(new):
+    crawler = new(sitemaps=True)
+    a, b, c = (f'{URL}{name}' for name in 'abc')
+    crawler._seed([(a, '2024-01-01'), (b, '2024-01-01')])
+    assert crawler.lastmods.get(a) == '2024-01-01'
+    handed = set()
+    while (url := crawler._next_url()) is not None:
+        crawler._explore(url)
+        crawler._release(url)
+        crawler._done(url)
+        handed.add(url)
+    assert handed == {URL, a, b}
+    crawler._seed([(a, '2024-01-01'), (b, '2024-02-01'), (c, None)])
+    # a is unchanged, b changed since its last crawl and c is new
+    assert crawler.refreshing == {b}
+    assert crawler.lastmods.get(b) == '2024-02-01' and crawler.lastmods.get(c) is None
+    assert {crawler._next_url(), crawler._next_url(), crawler._next_url()} == {b, c, None}
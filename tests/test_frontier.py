@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from frontier import FingerprintSet
+
+# fingerprints of a 16 slot table keep their low 4 bits as home slot, these crowd 4 homes,
+# two of them at the end of the table so probe chains wrap around
+CROWDED = [home + 16 * i for home in (0, 1, 14, 15) for i in range(1, 6)]
+
+
+def _same(s, model):
+    assert len(s) == len(model)
+    assert sorted(s) == sorted(model)
+    for fp in CROWDED:
+        assert (fp in s) == (fp in model)
+
+
+def test_discard_head_of_chain():
+    s = FingerprintSet(capacity=16)
+    chain = [14 + 16 * i for i in range(1, 6)]
+    for fp in chain:
+        s.add(fp)
+    s.discard(chain[0])
+    _same(s, set(chain[1:]))
+
+
+def test_discard_wrapped_entry():
+    s = FingerprintSet(capacity=16)
+    # 15 + 16 and 15 + 32 sit in slots 15 and 0, 0 + 16 is pushed to slot 1
+    for fp in (15 + 16, 15 + 32, 16):
+        s.add(fp)
+    s.discard(15 + 16)
+    _same(s, {15 + 32, 16})
+    s.discard(15 + 32)
+    _same(s, {16})
+
+
+def test_discard_missing():
+    s = FingerprintSet(capacity=16)
+    s.add(17)
+    s.discard(33)
+    _same(s, {17})
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_set(seed):
+    rnd = random.Random(seed)
+    s, model = FingerprintSet(capacity=16), set()
+    for _ in range(300):
+        fp = rnd.choice(CROWDED)
+        # stay below half full, the table never grows and chains stay long
+        if rnd.random() < 0.5 and len(model) < 8:
+            s.add(fp)
+            model.add(fp)
+        else:
+            s.discard(fp)
+            model.discard(fp)
+        _same(s, model)
+
+
+def test_grow_and_discard():
+    rnd = random.Random(0)
+    fps = {rnd.getrandbits(64) or 1 for _ in range(5000)}
+    s = FingerprintSet(capacity=16)
+    for fp in fps:
+        s.add(fp)
+    gone = set(list(fps)[::2])
+    for fp in gone:
+        s.discard(fp)
+    assert len(s) == len(fps - gone)
+    assert all(fp in s for fp in fps - gone)
+    assert not any(fp in s for fp in gone)
@@ -0,0 +1,48 @@
+import asyncio
+
+from governor import FairShare, Governor
+
+
+async def _crawl(fair, jobs):
+    order = []
+
+    async def fetch(share):
+        async with share.slot() as slot:
+            order.append(share.key)
+            await asyncio.sleep(0.001)
+            slot.observe(200)
+
+    tasks = [asyncio.create_task(fetch(fair.view(key))) for key, n in jobs for _ in range(n)]
+    return order, tasks
+
+
+def test_sites_take_turns():
+    async def main():
+        fair = FairShare(Governor(initial=2, maximum=2))
+        order, tasks = await _crawl(fair, [('big', 50), ('small', 5)])
+        await asyncio.gather(*tasks)
+        return order, fair
+
+    order, fair = asyncio.run(main())
+    assert len(order) == 55
+    # the small site is done long before the big one, though its fetches were queued last
+    assert max(i for i, key in enumerate(order) if key == 'small') < 15
+    assert fair.granted == 0 and not fair.turns and not fair.queues
+
+
+def test_cancelled_waiters_release_nothing():
+    async def main():
+        fair = FairShare(Governor(initial=1, maximum=1))
+        order, tasks = await _crawl(fair, [('a', 5), ('b', 5)])
+        await asyncio.sleep(0)
+        for task in tasks[1:4] + tasks[6:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # nothing is left waiting or holding a slot, a new fetch starts at once
+        async with fair.view('c').slot():
+            pass
+        return order, fair
+
+    order, fair = asyncio.run(asyncio.wait_for(main(), 5))
+    assert sorted(order) == ['a', 'a', 'b']
+    assert fair.granted == 0 and sum(fair.inflight.values()) == 0
@@ -0,0 +1,104 @@
+import threading
+
+import httpx
+import pytest
+
+from crawler import ImageCrawler
+
+URL = 'http://example.com/'
+PAGE = b'<html><title>t</title><div class="content"><img src="/1.png"></div></html>'
+
+
+def test_page_with_failing_image_is_given_up(tmp_path, monkeypatch):
+    # the page is fetched fine every time, its image never, the attempts of the page still run out
+    monkeypatch.chdir(tmp_path)
+    fetched = []
+
+    def handle(request):
+        if request.url.path == '/':
+            fetched.append(request.url)
+            return httpx.Response(200, content=PAGE, headers={'Content-Type': 'text/html'})
+        return httpx.Response(500)
+
+    crawler = ImageCrawler(URL, tmp_path / 'out', robots=False, backoff=0, breaker=None,
+                           transport=httpx.MockTransport(handle))
+    run = threading.Thread(target=crawler.crawl, args=([('div', {'class': 'content'}), ('img', {'src': True})],),
+                           daemon=True)
+    run.start()
+    run.join(10)
+    try:
+        assert not run.is_alive()
+        assert len(fetched) == crawler.attempt
+        assert URL not in crawler.scheduler.failed
+    finally:
+        crawler.writer.close()
+        crawler.journal.close()
+
+
+IMAGE = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def download(tmp_path, monkeypatch):
+    # downloads IMAGE from a server answering ranges, *start* overrides where its ranges start
+    monkeypatch.chdir(tmp_path)
+    requests, made = [], []
+
+    def download(part=None, validator=None, start=None):
+        def handle(request):
+            requests.append(request)
+            if 'Range' not in request.headers or request.headers.get('If-Range') != '"1"':
+                return httpx.Response(200, content=IMAGE, headers={'ETag': '"1"'})
+            first = int(request.headers['Range'][6:-1]) if start is None else start
+            return httpx.Response(206, content=IMAGE[first:],
+                                  headers={'Content-Range': f'bytes {first}-{len(IMAGE) - 1}/{len(IMAGE)}'})
+
+        crawler = ImageCrawler(URL, tmp_path / 'out', robots=False, transport=httpx.MockTransport(handle))
+        made.append(crawler)
+        p = tmp_path / 'out' / 'a.png'
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if part is not None:
+            (tmp_path / 'out' / 'a.png.part').write_bytes(part)
+        if validator is not None:
+            (tmp_path / 'out' / 'a.png.part.validator').write_text(validator)
+        crawler._claim(p)
+        kept = crawler._download(URL + 'a.png', URL, p)
+        crawler.writer.flush()
+        return kept, p
+
+    yield download, requests
+    for crawler in made:
+        crawler.writer.close()
+        crawler.journal.close()
+
+
+def test_part_resumed_if_unchanged(download):
+    download, requests = download
+    kept, p = download(IMAGE[:100], '"1"')
+    assert kept and p.read_bytes() == IMAGE
+    assert requests[0].headers['Range'] == 'bytes=100-'
+    assert not p.with_name('a.png.part.validator').exists()
+
+
+def test_part_without_validator_is_fetched_whole(download):
+    download, requests = download
+    kept, p = download(b'x' * 100)
+    assert kept and p.read_bytes() == IMAGE
+    assert 'Range' not in requests[0].headers
+
+
+def test_part_of_changed_image_is_replaced(download):
+    download, requests = download
+    kept, p = download(b'x' * 100, '"0"')
+    assert kept and p.read_bytes() == IMAGE
+    assert requests[0].headers['If-Range'] == '"0"'
+
+
+def test_range_not_at_part_end_restarts(download):
+    download, requests = download
+    kept, p = download(IMAGE[:100], '"1"', start=0)
+    assert not kept
+    assert not p.with_name('a.png.part').exists()
+    kept, p = download()
+    assert kept and p.read_bytes() == IMAGE
+    assert 'Range' not in requests[1].headers
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from journal import Journal, JournalDict
+
+GOOD = b'["a", "http://a/1", 0]\n["e", "http://a/1"]\n'
+
+
+def test_replay_in_order(tmp_path):
+    journal = Journal(tmp_path / 'j')
+    journal.append('a', 'http://a/1', 0)
+    journal.append('e', 'http://a/1')
+    journal.close()
+    assert list(Journal(tmp_path / 'j').replay()) == [['a', 'http://a/1', 0], ['e', 'http://a/1']]
+
+
+def test_replay_missing_file(tmp_path):
+    assert list(Journal(tmp_path / 'j').replay()) == []
+
+
+def test_torn_tail_is_dropped_and_truncated(tmp_path):
+    path = tmp_path / 'j'
+    path.write_bytes(GOOD + b'["a", "http://a/2"')
+    journal = Journal(path)
+    assert list(journal.replay()) == [['a', 'http://a/1', 0], ['e', 'http://a/1']]
+    assert journal.count == 2
+    assert path.read_bytes() == GOOD
+    # records appended after a torn tail start on a line of their own
+    journal.append('a', 'http://a/3', 1)
+    journal.close()
+    assert list(Journal(path).replay())[-1] == ['a', 'http://a/3', 1]
+
+
+def test_broken_line_ends_replay(tmp_path):
+    path = tmp_path / 'j'
+    path.write_bytes(GOOD + b'["a", "http://a/2", \n["e", "http://a/2"]\n')
+    assert len(list(Journal(path).replay())) == 2
+    assert path.read_bytes() == GOOD
+
+
+def test_journal_dict_survives_compaction(tmp_path):
+    d = JournalDict(tmp_path / 'd', compact_every=3)
+    for i in range(10):
+        d[f'k{i}'] = i
+    d.pop('k0')
+    d.flush()
+    assert (tmp_path / 'd').exists()
+    assert dict(JournalDict(tmp_path / 'd').items()) == {f'k{i}': i for i in range(1, 10)}
+
+
+def test_journal_dict_replays_unfinished_compaction(tmp_path):
+    # a kill between rotating the journal and writing the snapshot leaves the records in d.journal.1
+    (tmp_path / 'd').write_bytes(b'["s", "a", 1]\n')
+    (tmp_path / 'd.journal.1').write_bytes(b'["s", "a", 2]\n["s", "b", 1]\n')
+    (tmp_path / 'd.journal').write_bytes(b'["d", "b"]\n')
+    assert dict(JournalDict(tmp_path / 'd').items()) == {'a': 2}
+
+
+def test_append_leaves_fsync_to_background(tmp_path, monkeypatch):
+    synced = threading.Event()
+    threads = []
+    fsync = os.fsync
+
+    def record(fd):
+        threads.append(threading.current_thread())
+        fsync(fd)
+        synced.set()
+
+    monkeypatch.setattr(os, 'fsync', record)
+    journal = Journal(tmp_path / 'j', fsync_interval=0.01)
+    for i in range(100):
+        journal.append('a', f'http://a/{i}', 0)
+    assert synced.wait(5)
+    assert threading.current_thread() not in threads
+    journal.close()
@@ -0,0 +1,22 @@
+import crawler
+import multisite
+
+
+def test_transport_parameters_reach_the_shared_transport(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    seen = []
+
+    async def crawl_site(site, containers, redundant):
+        seen.append(site)
+
+    monkeypatch.setattr(multisite, '_crawl_site', crawl_site)
+    jobs = [('http://a.example/', [], None, crawler.TextCrawlerAsync),
+            ('http://b.example/', [], None, crawler.ImageCrawlerAsync)]
+    multisite.crawl_sites(jobs, tmp_path / 'out', follow_redirects=True, http2=True, dns_ttl=None, delay=0.5)
+    a, b = seen
+    assert a.session is b.session
+    assert a.session.kwargs == {'follow_redirects': True}
+    assert a.session.http2
+    # crawler parameters still reach every crawler
+    assert a.scheduler.delay == b.scheduler.delay == 0.5
+    assert a.data.name == 'a.example.snapshot'
@@ -0,0 +1,57 @@
+import pytest
+
+import recrawl
+from recrawl import Recrawl
+
+HOUR, DAY = 3600.0, 86400.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(recrawl.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def history(tmp_path):
+    visits = Recrawl(tmp_path / 'visits', min_interval=HOUR, max_interval=30 * DAY)
+    yield visits
+    visits.visits.journal.close()
+
+
+def visit_every(history, clock, url, seconds, digests):
+    for digest in digests:
+        history.visit(url, digest)
+        clock[0] += seconds
+
+
+def test_first_visit_looks_again_soon(history, clock):
+    assert history.visit('http://a/1', 'x')
+    assert history.interval('http://a/1') == HOUR
+
+
+def test_unchanged_page_drifts_to_max_interval(history, clock):
+    visit_every(history, clock, 'http://a/1', DAY, ['x', 'x', None, 'x'])
+    assert history.interval('http://a/1') == 30 * DAY
+
+
+def test_frequent_changes_shorten_the_interval(history, clock):
+    visit_every(history, clock, 'http://a/often', DAY, ['1', '2', '3', '4', '5'])
+    visit_every(history, clock, 'http://a/seldom', DAY, ['1', '1', '1', '2', '2'])
+    often, seldom = history.interval('http://a/often'), history.interval('http://a/seldom')
+    assert HOUR <= often < seldom < 30 * DAY
+
+
+def test_budget_keeps_the_most_overdue(history, clock):
+    history.visit('http://a/1', 'x')
+    history.visit('http://a/2', 'x')
+    clock[0] += 2 * HOUR
+    history.visit('http://a/2', 'x')
+    clock[0] += 10 * HOUR
+    history.visit('http://a/3', 'x')
+    clock[0] += 3 * HOUR
+    # a/1 waited 15 times its interval, a/3 3 times, a/2 was seen unchanged and is not due
+    assert history.due() == ['http://a/1', 'http://a/3']
+    history.budget = 1
+    assert history.due() == ['http://a/1']
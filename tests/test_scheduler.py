@@ -0,0 +1,94 @@
+import pytest
+
+from frontier import DiskFrontier, MemoryFrontier
+from scheduler import Scheduler
+
+
+@pytest.fixture(params=[MemoryFrontier, DiskFrontier])
+def frontier(request):
+    return request.param()
+
+
+def test_finished_crawl_hands_out_nothing(frontier):
+    # resuming a finished crawl replays urls added then explored, the queue holds explored urls only
+    for url in ('http://a/1', 'http://a/2'):
+        frontier.add(url)
+        frontier.explore(url)
+    scheduler = Scheduler(frontier)
+    assert scheduler.next() is None
+    assert scheduler.next() is None
+
+
+def test_explored_urls_are_skipped(frontier):
+    for url in ('http://a/1', 'http://a/2', 'http://a/3'):
+        frontier.add(url)
+    frontier.explore('http://a/2')
+    scheduler = Scheduler(frontier)
+    assert [scheduler.next(), scheduler.next(), scheduler.next()] == ['http://a/1', 'http://a/3', None]
+
+
+def test_shallow_urls_first(frontier):
+    frontier.add('http://a/deep', 3)
+    frontier.add('http://a/top', 0)
+    frontier.add('http://a/middle', 1)
+    scheduler = Scheduler(frontier)
+    assert [scheduler.next() for _ in range(3)] == ['http://a/top', 'http://a/middle', 'http://a/deep']
+
+
+def test_host_delay(frontier):
+    for url in ('http://a/1', 'http://a/2', 'http://b/1'):
+        frontier.add(url)
+    scheduler = Scheduler(frontier, delay=60)
+    assert scheduler.next() == 'http://a/1'
+    # host a waits for its delay, host b may start
+    assert scheduler.next() == 'http://b/1'
+    assert scheduler.next() is None
+    assert 0 < scheduler.wait_time() <= 60
+
+
+def test_retry_backs_off_until_attempts_run_out(frontier):
+    scheduler = Scheduler(frontier, attempts=3, backoff=1, max_backoff=3)
+    first = scheduler.retry('http://a/1')
+    assert 0.5 <= first <= 1
+    # a url put back already is not counted twice
+    assert scheduler.retry('http://a/1') == 0.0
+    scheduler.retrying.discard('http://a/1')
+    assert 1 <= scheduler.retry('http://a/1') <= 2
+    scheduler.retrying.discard('http://a/1')
+    assert scheduler.retry('http://a/1') is None
+    assert 'http://a/1' not in scheduler.failed
+
+
+def test_retry_after_is_kept(frontier):
+    scheduler = Scheduler(frontier, backoff=1)
+    assert scheduler.retry('http://a/1', retry_after=30) == 30
+
+
+def test_breaker_pauses_host(frontier):
+    for url in ('http://a/1', 'http://b/1'):
+        frontier.add(url)
+    scheduler = Scheduler(frontier, breaker=3, pause=60)
+    assert not scheduler.fail('http://a/0')
+    assert not scheduler.fail('http://a/0')
+    assert scheduler.fail('http://a/0')
+    assert scheduler.next() == 'http://b/1'
+    assert scheduler.next() is None
+    assert 59 < scheduler.wait_time() <= 60
+
+
+def test_success_resets_breaker(frontier):
+    scheduler = Scheduler(frontier, breaker=2)
+    scheduler.fail('http://a/0')
+    scheduler.succeed('http://a/1')
+    assert not scheduler.fail('http://a/0')
+
+
+def test_retried_success_keeps_attempts(frontier):
+    # a page fetched fine whose image failed is put back, fetching it again is no fresh start
+    scheduler = Scheduler(frontier, attempts=2, breaker=2, backoff=0)
+    scheduler.fail('http://a/1.png')
+    scheduler.retry('http://a/1')
+    scheduler.retrying.discard('http://a/1')
+    scheduler.succeed('http://a/1')
+    assert scheduler.fail('http://a/1.png')
+    assert scheduler.retry('http://a/1') is None
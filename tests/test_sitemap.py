@@ -0,0 +1,22 @@
+import gzip
+
+from sitemap import parse_sitemap
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+def test_gzipped_index():
+    index = (f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {NS}>'
+             + ''.join(f'<sitemap><loc> http://a/s{i}.xml.gz </loc><lastmod>2024-01-0{i}</lastmod></sitemap>'
+                       for i in range(1, 4))
+             + '<sitemap><loc>http://a/s4.xml</loc></sitemap><sitemap><loc></loc></sitemap></sitemapindex>')
+    # a small chunk splits the compressed stream and the entries anywhere
+    entries = list(parse_sitemap(gzip.compress(index.encode()), chunk=7))
+    assert entries == [('sitemap', 'http://a/s1.xml.gz', '2024-01-01'), ('sitemap', 'http://a/s2.xml.gz', '2024-01-02'),
+                       ('sitemap', 'http://a/s3.xml.gz', '2024-01-03'), ('sitemap', 'http://a/s4.xml', None)]
+
+
+def test_urlset():
+    urls = (f'<urlset {NS}><url><loc>http://a/1</loc><lastmod>2024-02-01</lastmod><priority>0.5</priority></url>'
+            '<url><loc>http://a/2</loc></url></urlset>')
+    assert list(parse_sitemap(urls.encode())) == [('url', 'http://a/1', '2024-02-01'), ('url', 'http://a/2', None)]
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+from storage import Manifest, Writer
+
+
+def test_waiting_coroutine_is_woken_by_a_finished_write():
+    writer = Writer(backlog=1)
+    release = threading.Event()
+    done = []
+
+    async def main():
+        writer.submit(release.wait)
+        waiting = asyncio.create_task(writer.asubmit(done.append, 1))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        await asyncio.wrap_future(await asyncio.wait_for(waiting, 5))
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        writer.close()
+    assert done == [1]
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    writer = Writer(backlog=1)
+    release = threading.Event()
+    done = []
+
+    async def main():
+        writer.submit(release.wait)
+        first = asyncio.create_task(writer.asubmit(done.append, 1))
+        second = asyncio.create_task(writer.asubmit(done.append, 2))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        release.set()
+        await asyncio.wrap_future(await asyncio.wait_for(second, 5))
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        writer.close()
+    assert done == [2]
+
+
+def test_file_work_is_not_queued_behind_writes():
+    writer = Writer(workers=1)
+    release = threading.Event()
+
+    async def main():
+        writer.submit(release.wait)
+        return await asyncio.wait_for(writer.arun(sum, [1, 2]), 5)
+
+    try:
+        assert asyncio.run(main()) == 3
+    finally:
+        release.set()
+        writer.close()
+
+
+def test_manifest_skips_unfinished_files(tmp_path):
+    root = tmp_path / 'out'
+    root.mkdir()
+    for name in ('a.png', 'b.png.part', 'b.png.part.validator', 'c.txt.tmp'):
+        (root / name).write_bytes(b'x')
+    manifest = Manifest(tmp_path / 'manifest', root)
+    assert len(manifest) == 1 and root / 'a.png' in manifest
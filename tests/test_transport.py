@@ -0,0 +1,28 @@
+import socket
+
+from transport import DNSCache, Transport
+
+
+def test_latest_install_sets_ttl_and_last_uninstall_restores():
+    original = socket.getaddrinfo
+    first = DNSCache.install(300)
+    second = DNSCache.install(5)
+    try:
+        assert first is second and socket.getaddrinfo is first
+        assert first.ttl == 5
+        DNSCache.uninstall()
+        assert socket.getaddrinfo is first
+    finally:
+        DNSCache.uninstall()
+    assert socket.getaddrinfo is original
+
+
+def test_transport_caches_until_closed():
+    original = socket.getaddrinfo
+    transport = Transport(dns_ttl=60)
+    assert socket.getaddrinfo.ttl == 60
+    transport.close()
+    transport.close()
+    assert socket.getaddrinfo is original
+    Transport(dns_ttl=None).close()
+    assert socket.getaddrinfo is original
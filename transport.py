@@ -0,0 +1,143 @@
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+from fake_useragent import UserAgent
+
+
+class DNSCache:
+    """
+    process wide cache in front of socket.getaddrinfo, which sync and async httpx clients both resolve with.
+    it stays in place until every install is matched by an uninstall, the latest install sets the ttl.
+    :param ttl: seconds a resolved address is reused.
+    """
+
+    _installed = None
+    _installs = 0
+    _lock = threading.Lock()
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+        self._getaddrinfo = socket.getaddrinfo
+
+    @classmethod
+    def install(cls, ttl=300):
+        with cls._lock:
+            if cls._installed is None:
+                cls._installed = cls(ttl)
+                socket.getaddrinfo = cls._installed
+            cls._installed.ttl = ttl
+            cls._installs += 1
+            return cls._installed
+
+    @classmethod
+    def uninstall(cls):
+        with cls._lock:
+            if cls._installed is None:
+                return
+            cls._installs -= 1
+            if not cls._installs:
+                # put back what was there, unless someone wrapped getaddrinfo again meanwhile
+                if socket.getaddrinfo is cls._installed:
+                    socket.getaddrinfo = cls._installed._getaddrinfo
+                cls._installed = None
+
+    def __call__(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        hit = self.entries.get(key)
+        now = time.monotonic()
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        result = self._getaddrinfo(host, port, family, type, proto, flags)
+        self.entries[key] = (now + self.ttl, result)
+        return result
+
+
+class Transport:
+    """
+    one pooled httpx client per host with long lived keep-alive connections,
+    a User-Agent pool loaded once and applied per request, and a resolver cache.
+    mirrors the client methods the crawlers use: get, stream, close and aclose.
+    :param asynchronous: build httpx.AsyncClient instead of httpx.Client.
+    :param limits: max connections per host, all of them may stay alive.
+    :param timeout: seconds, parameter pass to httpx.
+    :param http2: multiplex requests over HTTP/2 connections, needs the *h2* package.
+    :param keepalive_expiry: seconds an idle connection is kept.
+    :param dns_ttl: seconds resolved addresses are cached until the transport is closed, None to resolve every
+        connection, as long as no other open transport caches them.
+    :param agents: number of User-Agent strings to preload.
+    :param kwargs: other parameters pass to httpx client.
+    """
+
+    def __init__(self, asynchronous=False, limits=100, timeout=5, http2=False, keepalive_expiry=30.0,
+                 dns_ttl=300, agents=100, **kwargs):
+        self.asynchronous = asynchronous
+        self.limits = httpx.Limits(max_connections=limits, max_keepalive_connections=limits,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(timeout=timeout)
+        self.http2 = http2
+        self.kwargs = kwargs
+        self.clients = {}
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.dns = DNSCache.install(dns_ttl) if dns_ttl else None
+        ua = UserAgent()
+        self.agents = list({ua.random for _ in range(agents)})
+        self._trace = self._atrace if asynchronous else self._strace
+
+    def client(self, url):
+        host = urlparse(str(url)).netloc
+        client = self.clients.get(host)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(host)
+                if client is None:
+                    cls = httpx.AsyncClient if self.asynchronous else httpx.Client
+                    client = self.clients[host] = cls(limits=self.limits, timeout=self.timeout, http2=self.http2,
+                                                      headers={'Accept-Encoding': '*'}, **self.kwargs)
+        return client
+
+    def headers(self, headers=None):
+        h = {'User-Agent': random.choice(self.agents)}
+        if headers:
+            h.update(headers)
+        return h
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        return self.client(url).get(url, headers=self.headers(headers), extensions={'trace': self._trace})
+
+    def stream(self, method, url, headers=None):
+        self.requests += 1
+        return self.client(url).stream(method, url, headers=self.headers(headers), extensions={'trace': self._trace})
+
+    def _strace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            self.connections += 1
+
+    async def _atrace(self, event, info):
+        self._strace(event, info)
+
+    def reuse_rate(self):
+        """share of requests served over an already open connection."""
+        return 1 - self.connections / self.requests if self.requests else 0.0
+
+    def _uninstall(self):
+        if self.dns is not None:
+            self.dns = None
+            DNSCache.uninstall()
+
+    def close(self):
+        for client in list(self.clients.values()):
+            client.close()
+        self._uninstall()
+
+    async def aclose(self):
+        for client in list(self.clients.values()):
+            await client.aclose()
+        self._uninstall()